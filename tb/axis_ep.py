@@ -23,6 +23,7 @@ THE SOFTWARE.
 """
 
 from myhdl import *
+import mmap
 
 skip_asserts = False
 
@@ -83,57 +84,48 @@ class AXIStreamFrame(object):
         if self.data is None:
             return
 
-        f = list(self.data)
-        tdata = []
-        tkeep = []
-        tid = []
-        tdest = []
-        tuser = []
-        i = 0
-
-        while len(f) > 0:
-            if self.B == 0:
-                data = 0
-                keep = 0
-                for j in range(self.M):
-                    data = data | (f.pop(0) << (j*self.WL))
-                    keep = keep | (1 << j)
-                    if len(f) == 0: break
-                tdata.append(data)
-
-                if self.keep is None:
-                    tkeep.append(keep)
-                else:
-                    tkeep.append(self.keep[i])
-            else:
-                # multiple tdata signals
-                data = 0
-                tdata.append(f.pop(0))
-                tkeep.append(0)
-
-            if self.id is None:
-                tid.append(0)
-            elif type(self.id) is int:
-                tid.append(self.id)
-            else:
-                tid.append(self.id[i])
-
-            if self.dest is None:
-                tdest.append(0)
-            elif type(self.dest) is int:
-                tdest.append(self.dest)
+        if self.B == 0:
+            n = len(self.data)
+            M = self.M
+            if type(self.data) is bytearray and self.WL == 8:
+                mv = memoryview(self.data)
+                tdata = [int.from_bytes(mv[k:k+M], 'little') for k in range(0, n, M)]
             else:
-                tdest.append(self.dest[i])
-
-            if self.user is None:
-                tuser.append(0)
-            elif type(self.user) is int:
-                tuser.append(self.user)
+                tdata = []
+                for k in range(0, n, M):
+                    data = 0
+                    for j, w in enumerate(self.data[k:k+M]):
+                        data |= w << (j*self.WL)
+                    tdata.append(data)
+            cycles = len(tdata)
+
+            if self.keep is None:
+                tkeep = [2**M-1]*cycles
+                if n % M:
+                    tkeep[-1] = 2**(n % M)-1
             else:
-                tuser.append(self.user[i])
-            i += 1
+                tkeep = list(self.keep[:cycles])
+        else:
+            # multiple tdata signals
+            tdata = list(self.data)
+            cycles = len(tdata)
+            tkeep = [0]*cycles
+
+        # sideband signals stay scalar unless they vary per cycle
+        def sideband(val):
+            if val is None:
+                return 0
+            if type(val) in (int, bool):
+                return int(val)
+            return list(val[:cycles])
+
+        tid = sideband(self.id)
+        tdest = sideband(self.dest)
+        tuser = sideband(self.user)
 
         if self.last_cycle_user:
+            if type(tuser) is int:
+                tuser = [tuser]*cycles
             tuser[-1] = self.last_cycle_user
 
         return tdata, tkeep, tid, tdest, tuser
@@ -150,7 +142,35 @@ class AXIStreamFrame(object):
         self.dest = []
         self.user = []
 
-        if self.B == 0:
+        if self.B == 0 and self.WL == 8:
+            M = self.M
+            full = 2**M-1
+
+            # full beats convert directly, partial beats select lanes
+            data = bytearray()
+            for d, k in zip(tdata, tkeep):
+                b = int(d).to_bytes(M, 'little')
+                if k == full:
+                    data += b
+                    continue
+                if not k:
+                    continue
+                lo = (k & -k).bit_length()-1
+                hi = k.bit_length()
+                if k == (1 << hi) - (1 << lo):
+                    # contiguous
+                    data += b[lo:hi]
+                else:
+                    for j in range(M):
+                        if k & (1 << j):
+                            data.append(b[j])
+            self.data = data
+
+            self.keep = list(tkeep)
+            self.id = list(tid)
+            self.dest = list(tdest)
+            self.user = list(tuser)
+        elif self.B == 0:
             mask = 2**self.WL-1
 
             for i in range(len(tdata)):
@@ -245,6 +265,92 @@ class AXIStreamFrame(object):
     def __iter__(self):
         return self.data.__iter__()
 
+    def beats(self):
+        # iterate over (tdata, tkeep, tid, tdest, tuser) for each cycle
+        tdata, tkeep, tid, tdest, tuser = self.build()
+        for k in range(len(tdata)):
+            yield (tdata[k], tkeep[k],
+                tid[k] if type(tid) is list else tid,
+                tdest[k] if type(tdest) is list else tdest,
+                tuser[k] if type(tuser) is list else tuser)
+
+
+class AXIStreamLazyFrame(object):
+    # frame produced on demand from an iterator, file object, mmap or memoryview
+    # iterators may yield bytes-like chunks or individual bytes
+    # byte lanes only, sideband signals are constant for the frame
+    def __init__(self, data, id=0, dest=0, user=0, last_cycle_user=None, chunk_size=65536):
+        self.B = 0
+        self.N = 8
+        self.M = 1
+        self.WL = 8
+        self.data = data
+        self.id = id
+        self.dest = dest
+        self.user = user
+        self.last_cycle_user = last_cycle_user
+        self.chunk_size = chunk_size
+
+    def chunks(self):
+        data = self.data
+        if isinstance(data, (mmap.mmap, memoryview)):
+            mv = memoryview(data).cast('B')
+            try:
+                for k in range(0, len(mv), self.chunk_size):
+                    yield bytes(mv[k:k+self.chunk_size])
+            finally:
+                mv.release()
+        elif hasattr(data, 'read'):
+            while True:
+                chunk = data.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        else:
+            for chunk in data:
+                if type(chunk) is int:
+                    chunk = bytes((chunk,))
+                yield chunk
+
+    def beats(self):
+        if self.B != 0 or self.WL != 8:
+            raise Exception("Lazy frames require byte lanes")
+
+        M = self.M
+        full = 2**M-1
+        buf = bytearray()
+        last = None
+
+        for chunk in self.chunks():
+            buf += chunk
+            n = len(buf) - len(buf) % M
+            if not n:
+                continue
+            data = bytes(buf[:n])
+            del buf[:n]
+            for k in range(0, n, M):
+                # hold one beat back so the last one can carry last_cycle_user
+                if last is not None:
+                    yield (last, full, self.id, self.dest, self.user)
+                last = int.from_bytes(data[k:k+M], 'little')
+
+        if last is not None:
+            if buf:
+                yield (last, full, self.id, self.dest, self.user)
+            else:
+                yield (last, full, self.id, self.dest, self.last_cycle_user or self.user)
+        if buf:
+            yield (int.from_bytes(buf, 'little'), 2**len(buf)-1, self.id, self.dest, self.last_cycle_user or self.user)
+
+    def __repr__(self):
+        return (
+                ('AXIStreamLazyFrame(data=%s, ' % type(self.data).__name__) +
+                ('id=%s, ' % repr(self.id)) +
+                ('dest=%s, ' % repr(self.dest)) +
+                ('user=%s, ' % repr(self.user)) +
+                ('last_cycle_user=%s)' % repr(self.last_cycle_user))
+            )
+
 
 class AXIStreamSource(object):
     def __init__(self):
@@ -252,7 +358,13 @@ class AXIStreamSource(object):
         self.queue = []
 
     def send(self, frame):
-        self.queue.append(AXIStreamFrame(frame))
+        if isinstance(frame, AXIStreamLazyFrame):
+            self.queue.append(frame)
+        elif isinstance(frame, (mmap.mmap, memoryview)) or hasattr(frame, 'read') or iter(frame) is frame:
+            # iterators and file objects are streamed instead of copied
+            self.queue.append(AXIStreamLazyFrame(frame))
+        else:
+            self.queue.append(AXIStreamFrame(frame))
 
     def write(self, data):
         self.send(data)
@@ -293,11 +405,8 @@ class AXIStreamSource(object):
         @instance
         def logic():
             frame = AXIStreamFrame()
-            data = []
-            keep = []
-            id = []
-            dest = []
-            user = []
+            beats = iter(())
+            beat = None
             B = 0
             N = len(tdata)
             M = len(tkeep)
@@ -310,6 +419,19 @@ class AXIStreamSource(object):
                 M = 1
                 WL = [1]*B
 
+            def drive(beat):
+                data, keep, id, dest, user = beat
+                if B > 0:
+                    for i in range(B):
+                        tdata[i].next = data[i]
+                else:
+                    tdata.next = data
+                tkeep.next = keep
+                tid.next = id
+                tdest.next = dest
+                tuser.next = user
+                tvalid_int.next = True
+
             while True:
                 yield clk.posedge, rst.posedge
 
@@ -327,19 +449,11 @@ class AXIStreamSource(object):
                     tlast.next = False
                 else:
                     if tready_int and tvalid:
-                        if len(data) > 0:
-                            if B > 0:
-                                l = data.pop(0)
-                                for i in range(B):
-                                    tdata[i].next = l[i]
-                            else:
-                                tdata.next = data.pop(0)
-                            tkeep.next = keep.pop(0)
-                            tid.next = id.pop(0)
-                            tdest.next = dest.pop(0)
-                            tuser.next = user.pop(0)
-                            tvalid_int.next = True
-                            tlast.next = len(data) == 0
+                        if beat is not None:
+                            drive(beat)
+                            # look ahead one beat for tlast
+                            beat = next(beats, None)
+                            tlast.next = beat is None
                         else:
                             tvalid_int.next = False
                             tlast.next = False
@@ -350,21 +464,14 @@ class AXIStreamSource(object):
                             frame.N = N
                             frame.M = M
                             frame.WL = WL
-                            data, keep, id, dest, user = frame.build()
+                            beats = frame.beats()
+                            beat = next(beats, None)
                             if name is not None:
                                 print("[%s] Sending frame %s" % (name, repr(frame)))
-                            if B > 0:
-                                l = data.pop(0)
-                                for i in range(B):
-                                    tdata[i].next = l[i]
-                            else:
-                                tdata.next = data.pop(0)
-                            tkeep.next = keep.pop(0)
-                            tid.next = id.pop(0)
-                            tdest.next = dest.pop(0)
-                            tuser.next = user.pop(0)
-                            tvalid_int.next = True
-                            tlast.next = len(data) == 0
+                            if beat is not None:
+                                drive(beat)
+                                beat = next(beats, None)
+                                tlast.next = beat is None
 
         return instances()
 
@@ -373,20 +480,93 @@ class AXIStreamSink(object):
     def __init__(self):
         self.has_logic = False
         self.queue = []
+        # byte stream view, ring buffer of received byte frames
+        self.ring = bytearray(4096)
+        self.ring_head = 0
+        self.ring_count = 0
+        # stream view of frames with wider lanes
         self.read_queue = []
+        # toggles on each received frame
+        self.frame_event = Signal(bool(0))
+        self.callbacks = []
 
     def recv(self):
         if len(self.queue) > 0:
             return self.queue.pop(0)
         return None
 
-    def read(self, count=-1):
+    def ring_write(self, data):
+        n = len(data)
+        size = len(self.ring)
+        if self.ring_count + n > size:
+            # grow and move contents to start
+            while size < self.ring_count + n:
+                size *= 2
+            ring = bytearray(size)
+            self.ring_copy(memoryview(ring), self.ring_count)
+            self.ring = ring
+            self.ring_head = 0
+            size = len(ring)
+        tail = (self.ring_head + self.ring_count) % size
+        l = min(n, size - tail)
+        data = memoryview(data)
+        self.ring[tail:tail+l] = data[:l]
+        self.ring[0:n-l] = data[l:]
+        self.ring_count += n
+
+    def ring_copy(self, buf, n):
+        # copy n bytes from head of ring buffer without consuming
+        size = len(self.ring)
+        l = min(n, size - self.ring_head)
+        with memoryview(self.ring) as ring:
+            buf[:l] = ring[self.ring_head:self.ring_head+l]
+            buf[l:n] = ring[0:n-l]
+
+    def fill_ring(self):
+        # move received frames into stream view
         while len(self.queue) > 0:
-            self.read_queue.extend(self.queue.pop(0).data)
-        if count < 0:
-            count = len(self.read_queue)
-        data = self.read_queue[:count]
-        del self.read_queue[:count]
+            data = self.queue.pop(0).data
+            if type(data) is bytearray:
+                self.ring_write(data)
+            else:
+                self.read_queue.extend(data)
+
+    def read_count(self):
+        # number of bytes available in stream view
+        self.fill_ring()
+        return self.ring_count
+
+    def readinto(self, buf):
+        # read up to len(buf) bytes into buffer, returns number of bytes read
+        self.fill_ring()
+        buf = memoryview(buf).cast('B')
+        n = min(len(buf), self.ring_count)
+        self.ring_copy(buf, n)
+        self.ring_head = (self.ring_head + n) % len(self.ring)
+        self.ring_count -= n
+        return n
+
+    def read_exactly(self, count):
+        # read count bytes, or None without consuming if fewer are available
+        self.fill_ring()
+        if self.ring_count < count:
+            return None
+        data = bytearray(count)
+        self.readinto(data)
+        return data
+
+    def read(self, count=-1):
+        self.fill_ring()
+        if self.read_queue:
+            if count < 0:
+                count = len(self.read_queue)
+            data = self.read_queue[:count]
+            del self.read_queue[:count]
+            return data
+        if count < 0 or count > self.ring_count:
+            count = self.ring_count
+        data = bytearray(count)
+        self.readinto(data)
         return data
 
     def count(self):
@@ -395,6 +575,21 @@ class AXIStreamSink(object):
     def empty(self):
         return self.count() == 0
 
+    def add_callback(self, callback):
+        # called with each received frame
+        self.callbacks.append(callback)
+
+    def wait(self, count=1, timeout=0):
+        # generator, yield from test bench to wait until count frames are queued
+        # or timeout (simulation time) has elapsed, 0 waits indefinitely
+        if timeout:
+            end = now() + timeout
+            while len(self.queue) < count and now() < end:
+                yield self.frame_event, delay(end - now())
+        else:
+            while len(self.queue) < count:
+                yield self.frame_event
+
     def create_logic(self,
                 clk,
                 rst,
@@ -500,6 +695,9 @@ class AXIStreamSink(object):
                             self.queue.append(frame)
                             if name is not None:
                                 print("[%s] Got frame %s" % (name, repr(frame)))
+                            for callback in self.callbacks:
+                                callback(frame)
+                            self.frame_event.next = not self.frame_event
                             frame = AXIStreamFrame()
                             data = []
                             keep = []
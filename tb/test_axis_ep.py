@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2018 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+from myhdl import *
+import io
+import mmap
+import os
+
+import axis_ep
+
+def bench():
+
+    # Inputs
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+    current_test = Signal(intbv(0)[8:])
+
+    tdata = Signal(intbv(0)[32:])
+    tkeep = Signal(intbv(0)[4:])
+    tvalid = Signal(bool(0))
+    tready = Signal(bool(0))
+    tlast = Signal(bool(0))
+    tid = Signal(intbv(0)[8:])
+    tdest = Signal(intbv(0)[8:])
+    tuser = Signal(intbv(0)[8:])
+
+    source_pause = Signal(bool(0))
+
+    # sources and sinks
+    source = axis_ep.AXIStreamSource()
+
+    source_logic = source.create_logic(
+        clk,
+        rst,
+        tdata=tdata,
+        tkeep=tkeep,
+        tvalid=tvalid,
+        tready=tready,
+        tlast=tlast,
+        tid=tid,
+        tdest=tdest,
+        tuser=tuser,
+        pause=source_pause,
+        name='source'
+    )
+
+    sink = axis_ep.AXIStreamSink()
+
+    sink_logic = sink.create_logic(
+        clk,
+        rst,
+        tdata=tdata,
+        tkeep=tkeep,
+        tvalid=tvalid,
+        tready=tready,
+        tlast=tlast,
+        tid=tid,
+        tdest=tdest,
+        tuser=tuser,
+        name='sink'
+    )
+
+    @always(delay(4))
+    def clkgen():
+        clk.next = not clk
+
+    @instance
+    def check():
+        yield delay(100)
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+        yield delay(100)
+        yield clk.posedge
+
+        yield clk.posedge
+        print("test 1: frames")
+        current_test.next = 1
+
+        payloads = [bytearray(range(n)) for n in (1, 3, 4, 5, 8, 17)]
+
+        for p in payloads:
+            source.send(axis_ep.AXIStreamFrame(p, id=1, dest=2))
+
+        while sink.count() < len(payloads):
+            yield clk.posedge
+
+        for p in payloads:
+            rx_frame = sink.recv()
+            assert rx_frame.data == p
+            assert rx_frame.id == [1]*len(rx_frame.keep)
+            assert rx_frame.keep[-1] == 2**((len(p)-1) % 4 + 1)-1
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 2: lazy frames")
+        current_test.next = 2
+
+        payloads = []
+        for n in (1, 4, 5, 300):
+            p = bytearray((k*7) & 0xff for k in range(n))
+            payloads.append(p)
+
+            m = mmap.mmap(-1, n)
+            m[:] = p
+
+            source.send(io.BytesIO(p))
+            source.send(iter(p))
+            source.send(iter([p[k:k+3] for k in range(0, n, 3)]))
+            source.send(m)
+            source.send(memoryview(p))
+            source.send(axis_ep.AXIStreamLazyFrame(io.BytesIO(p), chunk_size=2))
+
+        # toggle pause while sending
+        k = 0
+        while sink.count() < len(payloads)*6:
+            yield clk.posedge
+            k += 1
+            source_pause.next = k % 5 == 2
+
+        source_pause.next = 0
+
+        for p in payloads:
+            for i in range(6):
+                rx_frame = sink.recv()
+                assert rx_frame.data == p
+                # tlast only on last beat
+                assert len(rx_frame.keep) == (len(p)+3) // 4
+
+        assert sink.empty()
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 3: lazy frame sideband")
+        current_test.next = 3
+
+        source.send(axis_ep.AXIStreamLazyFrame(io.BytesIO(b'abcdefgh'), id=3, dest=4, user=0, last_cycle_user=1, chunk_size=3))
+        source.send(axis_ep.AXIStreamLazyFrame(io.BytesIO(b'abcdefghi'), id=3, dest=4, user=0, last_cycle_user=1))
+
+        while sink.count() < 2:
+            yield clk.posedge
+
+        rx_frame = sink.recv()
+        assert rx_frame.data == b'abcdefgh'
+        assert rx_frame.keep == [0xf, 0xf]
+        assert rx_frame.id == [3, 3]
+        assert rx_frame.dest == [4, 4]
+        assert rx_frame.user == [0, 1]
+
+        rx_frame = sink.recv()
+        assert rx_frame.data == b'abcdefghi'
+        assert rx_frame.keep == [0xf, 0xf, 0x1]
+        assert rx_frame.user == [0, 0, 1]
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 4: byte stream reads")
+        current_test.next = 4
+
+        a = bytearray((k*13+1) & 0xff for k in range(3000))
+        b = bytearray((k*17+2) & 0xff for k in range(3000))
+        c = bytearray((k*19+3) & 0xff for k in range(1000))
+
+        source.send(a)
+
+        while sink.count() < 1:
+            yield clk.posedge
+
+        assert sink.read_exactly(2500) == a[:2500]
+
+        # second frame wraps around end of ring buffer
+        source.send(b)
+
+        while sink.count() < 1:
+            yield clk.posedge
+
+        assert sink.read_count() == 3500
+        assert sink.ring_head + sink.ring_count > len(sink.ring)
+
+        # third frame grows ring buffer while wrapped
+        source.send(c)
+
+        while sink.count() < 1:
+            yield clk.posedge
+
+        ref = a[2500:] + b + c
+
+        # not enough data, nothing consumed
+        assert sink.read_exactly(5000) is None
+        assert sink.read_count() == 4500
+
+        buf = bytearray(4000)
+        assert sink.readinto(memoryview(buf)) == 4000
+        assert buf == ref[:4000]
+
+        data = sink.read()
+        assert type(data) is bytearray
+        assert data == ref[4000:]
+
+        assert sink.read() == bytearray()
+        assert sink.readinto(bytearray(4)) == 0
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 5: frame notification")
+        current_test.next = 5
+
+        rx_log = []
+        sink.add_callback(lambda frame: rx_log.append((now(), bytes(frame.data))))
+
+        source.send(b'frame 1')
+        yield sink.wait()
+
+        # resumes in the same time step the frame completes
+        assert sink.count() == 1
+        assert rx_log == [(now(), b'frame 1')]
+
+        source.send(b'frame 2')
+        source.send(b'frame 3')
+        yield sink.wait(count=3)
+
+        assert sink.count() == 3
+        assert [d for t, d in rx_log] == [b'frame 1', b'frame 2', b'frame 3']
+        assert rx_log[-1][0] == now()
+
+        # timeout
+        t = now()
+        yield sink.wait(count=4, timeout=100)
+
+        assert now() - t == 100
+        assert sink.count() == 3
+        assert len(rx_log) == 3
+
+        assert sink.read() == b'frame 1frame 2frame 3'
+
+        yield delay(100)
+
+        raise StopSimulation
+
+    return instances()
+
+def test_bench():
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sim = Simulation(bench())
+    sim.run()
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_bench()
@@ -247,9 +247,14 @@ def bench():
                 source.send(bytearray(b'\xA2'+struct.pack('>IH', 256*(16*offset+length)+offset, length)+b'\x11\x22\x33\x44\x55\x66\x77\x88'[0:length]))
                 yield clk.posedge
 
-                yield input_axis_tvalid.negedge
+                yield sink.wait(timeout=1000)
 
-                yield delay(200)
+                # response is sent after the header, before the write
+                # completes, so wait for the write to land in memory
+                for k in range(200):
+                    if wb_ram_inst.compare(256*(16*offset+length)+offset, b'\x11\x22\x33\x44\x55\x66\x77\x88'[0:length]) is None:
+                        break
+                    yield clk.posedge
 
                 yield clk.posedge
 
@@ -276,9 +281,7 @@ def bench():
                 source.send(bytearray(b'\xA1'+struct.pack('>IH', 256*(16*offset+length)+offset, length)))
                 yield clk.posedge
 
-                yield input_axis_tvalid.negedge
-
-                yield delay(200)
+                yield sink.wait(timeout=1000)
 
                 yield clk.posedge
 
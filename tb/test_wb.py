@@ -25,6 +25,8 @@ THE SOFTWARE.
 
 from myhdl import *
 import os
+import array
+import tracemalloc
 
 import wb
 
@@ -84,6 +86,12 @@ def bench():
     def clkgen():
         clk.next = not clk
 
+    cyc_count = Signal(intbv(0)[32:])
+
+    @always(port0_cyc_i.posedge)
+    def cyc_monitor():
+        cyc_count.next = cyc_count + 1
+
     @instance
     def check():
         yield delay(100)
@@ -240,6 +248,237 @@ def bench():
 
         yield delay(100)
 
+        yield clk.posedge
+        print("test 9: transaction handles")
+        current_test.next = 9
+
+        writes = []
+        reads = []
+        for k in range(32):
+            writes.append(wb_master_inst.init_write(0x5000+k*4, bytearray([k, k+1, k+2, k+3])))
+        for k in range(32):
+            reads.append(wb_master_inst.init_read(0x5000+k*4, 4))
+
+        yield writes[15].wait()
+
+        assert writes[15].done
+        assert not writes[16].done
+        assert writes[15].start_time <= writes[15].end_time
+        assert wb_ram_inst.read_mem(0x5000+15*4, 4) == bytearray([15, 16, 17, 18])
+
+        yield reads[20].wait()
+
+        for k in range(21):
+            assert reads[k].done
+            assert reads[k].data == bytearray([k, k+1, k+2, k+3])
+
+        yield reads[-1].wait()
+
+        assert reads[-1].data == bytearray([31, 32, 33, 34])
+
+        for k in range(32):
+            wb_master_inst.get_read_data()
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 10: bulk commands")
+        current_test.next = 10
+
+        cmds = []
+        for k in range(64):
+            cmds.append(('w', 0x6000+k*4, bytearray([k]*4)))
+        for k in range(64):
+            cmds.append(('r', 0x6000+k*4, 4))
+
+        txns = wb_master_inst.init_bulk(cmds)
+        assert len(txns) == 128
+
+        yield txns[-1].wait()
+
+        data = wb_master_inst.get_read_data_bulk(16)
+        assert len(data) == 16
+        data += wb_master_inst.get_read_data_bulk()
+        assert len(data) == 64
+        assert not wb_master_inst.read_data_queue
+
+        for k in range(64):
+            assert data[k][0] == 0x6000+k*4
+            assert data[k][1] == bytearray([k]*4)
+
+        # submission cost at scale, commands are dropped before the master runs
+        cmds = [('r', 0x6000+(k % 64)*4, 4) for k in range(100000)]
+        tracemalloc.start()
+        txns = wb_master_inst.init_bulk(cmds)
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        wb_master_inst.command_queue.clear()
+
+        print("%d bytes per command" % (size // len(txns)))
+        assert len(txns) == 100000
+        assert size < 100000*256
+
+        # wrapping burst needs burst mode
+        try:
+            wb_master_inst.init_read(0x6000, 16, bte=1)
+        except Exception:
+            pass
+        else:
+            assert False
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 11: read into buffer")
+        current_test.next = 11
+
+        block = bytearray(range(64))
+        wb_ram_inst.write_mem(0x7000, block)
+
+        for offset in range(4):
+            buf = bytearray(32)
+            txn = wb_master_inst.init_read_into(0x7000+offset, memoryview(buf)[offset:offset+16])
+
+            yield txn.wait()
+
+            assert buf[offset:offset+16] == block[offset:offset+16]
+            assert buf[:offset] == bytearray(offset)
+            assert buf[offset+16:] == bytearray(16-offset)
+
+        buf = array.array('I', [0]*16)
+        txn = wb_master_inst.init_read_into(0x7000, buf)
+
+        yield txn.wait()
+
+        assert buf.tobytes() == block
+        assert not wb_master_inst.read_data_queue
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 12: typed words")
+        current_test.next = 12
+
+        words = [0x0123456789abcdeffedcba9876543210 + k for k in range(4)]
+
+        wb_master_inst.init_write_words(0x8000/16, words, 16)
+        wb_master_inst.init_write_words(0x8040/4, [0x12345678, 0x9abcdef0], 4, byteorder='big')
+        wb_master_inst.init_read_words(0x8000/16, 4, 16)
+        wb_master_inst.init_read_words(0x8040/4, 2, 4)
+
+        yield wb_master_inst.wait()
+        yield clk.posedge
+
+        assert wb_ram_inst.read_mem(0x8000, 16) == words[0].to_bytes(16, 'little')
+        assert wb_ram_inst.read_mem(0x8040, 8) == b'\x12\x34\x56\x78\x9a\xbc\xde\xf0'
+        assert wb_ram_inst.read_words(0x8000/16, 4, 16) == words
+        assert wb_ram_inst.read_dwords(0x8040/4, 2) == [0x78563412, 0xf0debc9a]
+
+        data = wb_master_inst.get_read_data_words(16)
+        assert data[0] == 0x8000/16
+        assert data[1] == words
+
+        data = wb_master_inst.get_read_data_words(4, byteorder='big')
+        assert data[0] == 0x8040/4
+        assert data[1] == [0x12345678, 0x9abcdef0]
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 13: locked sequence")
+        current_test.next = 13
+
+        count = int(cyc_count)
+
+        txns = wb_master_inst.init_locked([
+            ('w', 0x9000, b'\x11\x22\x33\x44'),
+            ('w', 0x9004, b'\x55\x66\x77\x88'),
+            ('r', 0x9000, 8)
+        ])
+
+        yield txns[-1].wait()
+        yield clk.posedge
+
+        assert int(cyc_count) == count + 1
+        assert txns[-1].data == b'\x11\x22\x33\x44\x55\x66\x77\x88'
+        assert txns[1].end_time <= txns[2].start_time
+
+        wb_master_inst.get_read_data()
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 14: trace capture and replay")
+        current_test.next = 14
+
+        wb_ram_inst.start_trace()
+
+        wb_master_inst.init_write(0xa001, b'\x11\x22\x33\x44\x55\x66')
+        wb_master_inst.init_read(0xa000, 8)
+
+        yield wb_master_inst.wait()
+        yield clk.posedge
+
+        trace = wb_ram_inst.stop_trace()
+        trace.save('test_wb.trace')
+
+        # packed records, 4 byte accesses cost record size plus data
+        assert os.path.getsize('test_wb.trace') == wb.WBTrace.header.size + 4*(wb.WBTrace.record.size+4)
+        assert wb.WBTrace.record.size <= 24
+
+        records = list(trace)
+        assert len(records) == 4
+        assert [r[4] for r in records] == [True, True, False, False]
+        assert records[0][2:4] == (0xa000, 0xe)
+        assert records[3][6] == b'\x44\x55\x66\x00'
+        assert wb_master_inst.get_read_data()[1] == b'\x00\x11\x22\x33\x44\x55\x66\x00'
+
+        # clear and replay
+        wb_ram_inst.write_mem(0xa000, bytearray(8))
+
+        trace = wb.WBTrace.load('test_wb.trace')
+        os.remove('test_wb.trace')
+
+        assert len(trace) == 4
+
+        # original format still loads
+        with open('test_wb.trace', 'wb') as f:
+            f.write(wb.WBTrace.header.pack(wb.WBTrace.magic_v1, 1, 4))
+            f.write(array.array('Q', (5, 0, 0xa000, 0xf, 1, 4, 4)).tobytes())
+            f.write(b'\x01\x02\x03\x04')
+        assert list(wb.WBTrace.load('test_wb.trace')) == [(5, 0, 0xa000, 0xf, True, 4, b'\x01\x02\x03\x04')]
+        os.remove('test_wb.trace')
+
+        yield trace.replay(clk, wb_master_inst)
+
+        assert wb_ram_inst.read_mem(0xa000, 8) == b'\x00\x11\x22\x33\x44\x55\x66\x00'
+        assert wb_master_inst.get_read_data()[1] == b'\x00\x11\x22\x33'
+        assert wb_master_inst.get_read_data()[1] == b'\x44\x55\x66\x00'
+
+        # partial read select, trace streamed to file
+        wb_ram_inst.start_trace('test_wb.trace', flush_size=1)
+
+        wb_master_inst.init_read(0xa001, 2)
+        wb_master_inst.init_write(0xa004, b'\x77')
+
+        yield wb_master_inst.wait()
+        yield clk.posedge
+
+        wb_master_inst.get_read_data()
+
+        trace = wb_ram_inst.stop_trace()
+        trace.save('test_wb_copy.trace')
+
+        records = list(wb.WBTrace.load('test_wb_copy.trace'))
+        os.remove('test_wb.trace')
+        os.remove('test_wb_copy.trace')
+
+        assert len(records) == 2
+        assert records[0][2:5] == (0xa000, 0x6, False)
+        assert records[1][2:5] == (0xa004, 0x1, True)
+
+        yield delay(100)
+
         raise StopSimulation
 
     return instances()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2015-2016 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+from myhdl import *
+import os
+
+import wb
+
+def bench():
+
+    # Inputs
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+    current_test = Signal(intbv(0)[8:])
+
+    port0_adr_i = Signal(intbv(0)[32:])
+    port0_dat_i = Signal(intbv(0)[32:])
+    port0_we_i = Signal(bool(0))
+    port0_sel_i = Signal(intbv(0)[4:])
+    port0_stb_i = Signal(bool(0))
+    port0_cyc_i = Signal(bool(0))
+    port0_lock_i = Signal(bool(0))
+
+    port1_adr_i = Signal(intbv(0)[32:])
+    port1_dat_i = Signal(intbv(0)[32:])
+    port1_we_i = Signal(bool(0))
+    port1_sel_i = Signal(intbv(0)[4:])
+    port1_stb_i = Signal(bool(0))
+    port1_cyc_i = Signal(bool(0))
+
+    # Outputs
+    port0_dat_o = Signal(intbv(0)[32:])
+    port0_ack_o = Signal(bool(0))
+    port0_stall_o = Signal(bool(0))
+
+    port1_dat_o = Signal(intbv(0)[32:])
+    port1_ack_o = Signal(bool(0))
+    port1_stall_o = Signal(bool(0))
+
+    # WB master
+    wb_master_inst = wb.WBMaster()
+
+    wb_master_logic = wb_master_inst.create_logic(
+        clk,
+        adr_o=port0_adr_i,
+        dat_i=port0_dat_o,
+        dat_o=port0_dat_i,
+        we_o=port0_we_i,
+        sel_o=port0_sel_i,
+        stb_o=port0_stb_i,
+        ack_i=port0_ack_o,
+        cyc_o=port0_cyc_i,
+        stall_i=port0_stall_o,
+        lock_o=port0_lock_i,
+        pipelined=True,
+        max_outstanding=4,
+        keep_cyc=True,
+        name='master'
+    )
+
+    # WB RAM model
+    wb_ram_inst = wb.WBRam(2**16)
+
+    wb_ram_port0 = wb_ram_inst.create_port(
+        clk,
+        adr_i=port0_adr_i,
+        dat_i=port0_dat_i,
+        dat_o=port0_dat_o,
+        we_i=port0_we_i,
+        sel_i=port0_sel_i,
+        stb_i=port0_stb_i,
+        ack_o=port0_ack_o,
+        cyc_i=port0_cyc_i,
+        stall_o=port0_stall_o,
+        latency=1,
+        pipelined=True,
+        fifo_depth=4,
+        name='port0'
+    )
+
+    # WB master, slow port
+    wb_master1_inst = wb.WBMaster()
+
+    wb_master1_logic = wb_master1_inst.create_logic(
+        clk,
+        adr_o=port1_adr_i,
+        dat_i=port1_dat_o,
+        dat_o=port1_dat_i,
+        we_o=port1_we_i,
+        sel_o=port1_sel_i,
+        stb_o=port1_stb_i,
+        ack_i=port1_ack_o,
+        cyc_o=port1_cyc_i,
+        stall_i=port1_stall_o,
+        pipelined=True,
+        max_outstanding=8,
+        name='master1'
+    )
+
+    wb_ram_port1 = wb_ram_inst.create_port(
+        clk,
+        adr_i=port1_adr_i,
+        dat_i=port1_dat_i,
+        dat_o=port1_dat_o,
+        we_i=port1_we_i,
+        sel_i=port1_sel_i,
+        stb_i=port1_stb_i,
+        ack_o=port1_ack_o,
+        cyc_i=port1_cyc_i,
+        stall_o=port1_stall_o,
+        latency=wb.RandomLatency([2, 3, 4, 8], seed=1),
+        pipelined=True,
+        fifo_depth=2,
+        name='port1'
+    )
+
+    @always(delay(4))
+    def clkgen():
+        clk.next = not clk
+
+    lock_log = []
+
+    @always(clk.posedge)
+    def lock_monitor():
+        # lock state of each accepted request
+        if port0_cyc_i and port0_stb_i and not port0_stall_o:
+            lock_log.append(bool(port0_lock_i))
+
+    @instance
+    def check():
+        yield delay(100)
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+        yield delay(100)
+        yield clk.posedge
+
+        yield clk.posedge
+        print("test 1: write")
+        current_test.next = 1
+
+        wb_master_inst.init_write(4, b'\x11\x22\x33\x44')
+
+        yield wb_master_inst.wait()
+        yield clk.posedge
+
+        data = wb_ram_inst.read_mem(0, 32)
+        for i in range(0, len(data), 16):
+            print(" ".join(("{:02x}".format(c) for c in bytearray(data[i:i+16]))))
+
+        assert wb_ram_inst.read_mem(4,4) == b'\x11\x22\x33\x44'
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 2: read")
+        current_test.next = 2
+
+        wb_master_inst.init_read(4, 4)
+
+        yield wb_master_inst.wait()
+        yield clk.posedge
+
+        data = wb_master_inst.get_read_data()
+        assert data[0] == 4
+        assert data[1] == b'\x11\x22\x33\x44'
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 3: various writes")
+        current_test.next = 3
+
+        for length in range(1,8):
+            for offset in range(4,8):
+                wb_ram_inst.write_mem(256*(16*offset+length), b'\xAA'*32)
+                wb_master_inst.init_write(256*(16*offset+length)+offset, b'\x11\x22\x33\x44\x55\x66\x77\x88'[0:length])
+
+                yield wb_master_inst.wait()
+                yield clk.posedge
+
+                assert wb_ram_inst.read_mem(256*(16*offset+length)+offset, length) == b'\x11\x22\x33\x44\x55\x66\x77\x88'[0:length]
+                assert wb_ram_inst.read_mem(256*(16*offset+length)+offset-1, 1) == b'\xAA'
+                assert wb_ram_inst.read_mem(256*(16*offset+length)+offset+length, 1) == b'\xAA'
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 4: various reads")
+        current_test.next = 4
+
+        for length in range(1,8):
+            for offset in range(4,8):
+                wb_master_inst.init_read(256*(16*offset+length)+offset, length)
+
+                yield wb_master_inst.wait()
+                yield clk.posedge
+
+                data = wb_master_inst.get_read_data()
+                assert data[0] == 256*(16*offset+length)+offset
+                assert data[1] == b'\x11\x22\x33\x44\x55\x66\x77\x88'[0:length]
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 5: throughput")
+        current_test.next = 5
+
+        block = bytearray(range(256))
+
+        start = now()
+        wb_master_inst.init_write(0x1000, block)
+        yield wb_master_inst.wait()
+        write_cycles = int((now() - start)/8)
+
+        start = now()
+        wb_master_inst.init_read(0x1000, 256)
+        yield wb_master_inst.wait()
+        read_cycles = int((now() - start)/8)
+
+        print("write: %d cycles, read: %d cycles" % (write_cycles, read_cycles))
+
+        # one beat per cycle
+        assert write_cycles <= 64+4
+        assert read_cycles <= 64+4
+
+        assert wb_ram_inst.read_mem(0x1000, 256) == block
+        data = wb_master_inst.get_read_data()
+        assert data[0] == 0x1000
+        assert data[1] == block
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 6: stall")
+        current_test.next = 6
+
+        block = bytearray(range(255, -1, -1))
+
+        wb_master1_inst.stats.reset()
+
+        wb_master1_inst.init_write(0x2001, block)
+        wb_master1_inst.init_read(0x2001, 256)
+
+        yield wb_master1_inst.wait()
+        yield clk.posedge
+
+        print(wb_master1_inst.stats)
+
+        assert wb_master1_inst.stats.wait_states > 0
+
+        assert wb_ram_inst.read_mem(0x2001, 256) == block
+        data = wb_master1_inst.get_read_data()
+        assert data[0] == 0x2001
+        assert data[1] == block
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 7: back to back commands")
+        current_test.next = 7
+
+        start = now()
+        for k in range(16):
+            wb_master_inst.init_write(0x3000+k*4, bytearray([k]*4))
+        yield wb_master_inst.wait()
+        cycles = int((now() - start)/8)
+
+        print("%d cycles" % cycles)
+
+        # no idle cycles between commands
+        assert cycles <= 16+4
+
+        for k in range(16):
+            assert wb_ram_inst.read_mem(0x3000+k*4, 4) == bytearray([k]*4)
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 8: statistics")
+        current_test.next = 8
+
+        wb_master_inst.stats.reset()
+
+        for k in range(16):
+            wb_master_inst.init_read(0x3000+k*4, 4)
+        wb_master_inst.init_read(0x1000, 256)
+        yield wb_master_inst.wait()
+
+        stats = wb_master_inst.stats
+        print(stats)
+
+        assert stats.period == 8
+        assert stats.count == 17
+        assert stats.read_bytes == 16*4+256
+        assert stats.wait_states == 0
+        assert stats.percentile(50) == 2
+        assert stats.histogram()[2] == 17
+        assert stats.percentile(99, 'duration') == 65
+        assert stats.bytes_per_cycle() > 3.5
+
+        wb_master_inst.get_read_data_bulk()
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 9: locked sequence followed by unlocked commands")
+        current_test.next = 9
+
+        del lock_log[:]
+
+        wb_master_inst.init_locked([
+            ('w', 0x4000, b'\x11\x22\x33\x44'),
+            ('w', 0x4004, b'\x55\x66\x77\x88')
+        ])
+        wb_master_inst.init_write(0x4008, b'\x99\xaa\xbb\xcc')
+        wb_master_inst.init_write(0x400c, b'\xdd\xee\xff\x00')
+        yield wb_master_inst.wait()
+
+        print(lock_log)
+        assert lock_log == [True, True, False, False]
+
+        yield delay(100)
+
+        raise StopSimulation
+
+    return instances()
+
+def test_bench():
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sim = Simulation(bench())
+    sim.run()
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_bench()
@@ -24,6 +24,7 @@ THE SOFTWARE.
 """
 
 from myhdl import *
+import array
 import os
 
 import wb
@@ -101,6 +102,10 @@ def bench():
 
         assert wb_ram_inst.read_mem(0,4) == b'test'
 
+        # typed buffers are written as bytes
+        wb_ram_inst.write_mem(0x40, array.array('I', [0x44332211, 0x88776655]))
+        assert wb_ram_inst.read_mem(0x40, 8) == array.array('I', [0x44332211, 0x88776655]).tobytes()
+
         yield delay(100)
 
         yield clk.posedge
@@ -244,6 +249,348 @@ def bench():
 
         yield delay(100)
 
+        yield clk.posedge
+        print("test 5: sparse memory")
+        current_test.next = 5
+
+        sparse_ram_inst = wb.WBRam(2**32, sparse=True, page_size=4096, fill=b'\xde\xad\xbe\xef')
+
+        assert sparse_ram_inst.read_mem(0xfffffff0, 8) == b'\xde\xad\xbe\xef'*2
+        assert sparse_ram_inst.read_mem(0x12345ffe, 4) == b'\xbe\xef\xde\xad'
+
+        sparse_ram_inst.write_mem(0x12345ffe, b'\x11\x22\x33\x44')
+        assert len(sparse_ram_inst.pages) == 2
+        assert sparse_ram_inst.read_mem(0x12345ffc, 8) == b'\xde\xad\x11\x22\x33\x44\xbe\xef'
+
+        sparse_ram_inst.write_dwords(0xfffffffc/4, [0x12345678])
+        assert len(sparse_ram_inst.pages) == 3
+        assert sparse_ram_inst.read_dwords(0xfffffff8/4, 2) == [0xefbeadde, 0x12345678]
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 6: file backed memory")
+        current_test.next = 6
+
+        wb_ram_inst.write_mem(0, bytearray(range(256)))
+        wb_ram_inst.snapshot('test_wb_ram_model.bin', 0, 4096)
+
+        with open('test_wb_ram_model.bin', 'rb') as f:
+            assert f.read() == wb_ram_inst.read_mem(0, 4096)
+
+        # copy on write
+        file_ram_inst = wb.WBRam(filename='test_wb_ram_model.bin', access='c')
+        assert file_ram_inst.size == 4096
+        assert file_ram_inst.read_mem(0, 256) == bytearray(range(256))
+        file_ram_inst.write_mem(0, b'test')
+        assert file_ram_inst.read_mem(0, 4) == b'test'
+        file_ram_inst.close()
+
+        with open('test_wb_ram_model.bin', 'rb') as f:
+            assert f.read(4) == b'\x00\x01\x02\x03'
+
+        # write through
+        file_ram_inst = wb.WBRam(8192, filename='test_wb_ram_model.bin', access='w')
+        file_ram_inst.write_mem(4096, b'test')
+        file_ram_inst.flush()
+        file_ram_inst.close()
+
+        with open('test_wb_ram_model.bin', 'rb') as f:
+            data = f.read()
+        assert len(data) == 8192
+        assert data[4096:4100] == b'test'
+
+        # read only
+        file_ram_inst = wb.WBRam(filename='test_wb_ram_model.bin', access='r')
+        assert file_ram_inst.read_mem(4096, 4) == b'test'
+        file_ram_inst.close()
+
+        # load
+        sparse_ram_inst.load('test_wb_ram_model.bin', 0x80000000)
+        assert sparse_ram_inst.read_mem(0x80000000+4096, 4) == b'test'
+        wb_ram_inst.load('test_wb_ram_model.bin', 0x8000)
+        assert wb_ram_inst.read_mem(0x8000+4096, 4) == b'test'
+
+        os.remove('test_wb_ram_model.bin')
+
+        # new file needs a size
+        try:
+            wb.WBRam(filename='test_wb_ram_model.bin', access='w')
+        except Exception as e:
+            assert 'Size' in str(e)
+        else:
+            assert False
+        assert not os.path.exists('test_wb_ram_model.bin')
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 7: latency models")
+        current_test.next = 7
+
+        model = wb.RandomLatency([1, 2, 3], seed=1)
+        lat = [model(0, 0) for i in range(1000)]
+        assert set(lat) == set([1, 2, 3])
+        model = wb.RandomLatency([1, 2, 3], seed=1)
+        assert [model(0, 0) for i in range(1000)] == lat
+
+        model = wb.RandomLatency([1, 10], weights=[1, 0], seed=2)
+        assert set(model(0, 0) for i in range(100)) == set([1])
+
+        model = wb.RegionLatency([(0x1000, 0x2000, 5), (0x0000, 0x1000, 2)], default=7)
+        assert model(0x0800, 0) == 2
+        assert model(0x1000, 0) == 5
+        assert model(0x1fff, 0) == 5
+        assert model(0x2000, 0) == 7
+
+        model = wb.RefreshLatency(period=100, duration=10, base=1)
+        assert model(0, 0) == 11
+        assert model(0, 5) == 6
+        assert model(0, 10) == 1
+        assert model(0, 99) == 1
+        assert model(0, 203) == 8
+
+        with open('test_wb_ram_model.txt', 'w') as f:
+            f.write('1 2 3\n4\n')
+        model = wb.TraceLatency('test_wb_ram_model.txt')
+        assert [model(0, 0) for i in range(6)] == [1, 2, 3, 4, 1, 2]
+        os.remove('test_wb_ram_model.txt')
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 8: checkpoint and restore")
+        current_test.next = 8
+
+        wb_ram_inst.write_mem(0x2000, b'\x11\x11\x11\x11')
+
+        cp = wb_ram_inst.checkpoint()
+
+        wb_ram_inst.write_mem(0x2000, b'\x22\x22\x22\x22')
+
+        # write via port0
+        yield clk.posedge
+        port0_adr_i.next = 0x3000
+        port0_dat_i.next = 0x44332211
+        port0_sel_i.next = 0xF
+        port0_we_i.next = 1
+
+        port0_cyc_i.next = 1
+        port0_stb_i.next = 1
+
+        yield port0_ack_o.posedge
+        yield clk.posedge
+        port0_we_i.next = 0
+        port0_cyc_i.next = 0
+        port0_stb_i.next = 0
+
+        assert wb_ram_inst.read_mem(0x3000, 4) == b'\x11\x22\x33\x44'
+        assert sorted(wb_ram_inst.checkpoints[cp]) == [2, 3]
+
+        cp2 = wb_ram_inst.checkpoint()
+
+        wb_ram_inst.write_mem(0x2000, b'\x33\x33\x33\x33')
+        wb_ram_inst.write_mem(0x5ffe, b'\x33\x33\x33\x33')
+
+        wb_ram_inst.restore(cp2)
+
+        assert wb_ram_inst.read_mem(0x2000, 4) == b'\x22\x22\x22\x22'
+        assert wb_ram_inst.read_mem(0x5ffe, 4) == bytes(4)
+        assert wb_ram_inst.read_mem(0x3000, 4) == b'\x11\x22\x33\x44'
+
+        wb_ram_inst.restore(cp)
+
+        assert wb_ram_inst.read_mem(0x2000, 4) == b'\x11\x11\x11\x11'
+        assert wb_ram_inst.read_mem(0x3000, 4) == bytes(4)
+        assert len(wb_ram_inst.checkpoints) == 1
+
+        # restore again after further writes
+        wb_ram_inst.write_mem(0x2000, b'\x44\x44\x44\x44')
+        wb_ram_inst.restore(cp)
+        assert wb_ram_inst.read_mem(0x2000, 4) == b'\x11\x11\x11\x11'
+
+        wb_ram_inst.release(cp)
+        assert not wb_ram_inst.checkpoints
+
+        # sparse memory
+        ram = wb.WBRam(2**32, sparse=True, page_size=256)
+        ram.write_mem(0x100, b'\x11')
+        cp = ram.checkpoint()
+        ram.write_mem(0x100, b'\x22')
+        ram.write_mem(0x10000000, b'\x22')
+        ram.restore(cp)
+        assert ram.read_mem(0x100, 1) == b'\x11'
+        assert sorted(ram.pages) == [1]
+
+        # typed buffer crossing pages
+        cp = ram.checkpoint()
+        ram.write_mem(0x1fc, array.array('I', [0x11111111, 0x22222222, 0x33333333]))
+        assert ram.read_mem(0x204, 4) == b'\x33\x33\x33\x33'
+        ram.restore(cp)
+        assert sorted(ram.pages) == [1]
+        assert ram.read_mem(0x1fc, 12) == bytes(12)
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 9: peripheral regions")
+        current_test.next = 9
+
+        class Regs(object):
+            def __init__(self):
+                self.regs = bytearray(16)
+            def read(self, offset, length):
+                return self.regs[offset:offset+length]
+            def write(self, offset, data):
+                self.regs[offset:offset+len(data)] = data
+
+        regs = Regs()
+        doorbell = []
+
+        backing = wb_ram_inst.read_mem(0x8000, 16)
+
+        wb_ram_inst.add_region(0x8000, 16, regs)
+        wb_ram_inst.add_region(0x8010, 4, write=lambda offset, data: doorbell.append((offset, bytes(data))))
+
+        for i in range(100):
+            wb_ram_inst.add_region(0x9000+i*16, 16, read=lambda offset, length, i=i: bytes([i])*length)
+
+        try:
+            wb_ram_inst.add_region(0x800c, 8, regs)
+        except Exception:
+            pass
+        else:
+            assert False
+
+        # partial write via port0
+        yield clk.posedge
+        port0_adr_i.next = 0x8004
+        port0_dat_i.next = 0x44332211
+        port0_sel_i.next = 0xD
+        port0_we_i.next = 1
+
+        port0_cyc_i.next = 1
+        port0_stb_i.next = 1
+
+        yield port0_ack_o.posedge
+        yield clk.posedge
+        port0_we_i.next = 0
+        port0_cyc_i.next = 0
+        port0_stb_i.next = 0
+
+        assert regs.regs[4:8] == b'\x11\x00\x33\x44'
+
+        # write to doorbell
+        yield clk.posedge
+        port0_adr_i.next = 0x8010
+        port0_dat_i.next = 0x00000001
+        port0_sel_i.next = 0xF
+        port0_we_i.next = 1
+
+        port0_cyc_i.next = 1
+        port0_stb_i.next = 1
+
+        yield port0_ack_o.posedge
+        yield clk.posedge
+        port0_we_i.next = 0
+        port0_cyc_i.next = 0
+        port0_stb_i.next = 0
+
+        assert doorbell == [(0, b'\x01\x00\x00\x00')]
+
+        # read via port0
+        yield clk.posedge
+        port0_adr_i.next = 0x9320
+        port0_we_i.next = 0
+
+        port0_cyc_i.next = 1
+        port0_stb_i.next = 1
+
+        yield port0_ack_o.posedge
+        yield clk.posedge
+        port0_cyc_i.next = 0
+        port0_stb_i.next = 0
+
+        assert int(port0_dat_o) == 0x32323232
+
+        # transaction level access
+        wb_ram_inst.tlm_write(0x8008, b'\xaa\xbb')
+        assert regs.regs[8:10] == b'\xaa\xbb'
+        assert wb_ram_inst.tlm_read(0x8004, 6) == b'\x11\x00\x33\x44\xaa\xbb'
+        assert wb_ram_inst.tlm_read(0x8010, 4) == bytes(4)
+
+        # backing storage is not touched
+        assert wb_ram_inst.read_mem(0x8000, 16) == backing
+
+        wb_ram_inst.remove_region(0x8000)
+        assert wb_ram_inst.tlm_read(0x8000, 16) == backing
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 10: compare and diff")
+        current_test.next = 10
+
+        ram1 = wb.WBRam(2**20)
+        ram2 = wb.WBRam(2**20)
+
+        ram1.write_mem(0x1000, b'\x11\x22\x33\x44')
+        ram2.write_mem(0x1000, b'\x11\x22\x33\x44')
+
+        assert ram1.compare(0x1000, b'\x11\x22\x33\x44') is None
+        assert ram1.compare(0x1000, b'\x11\x22\x00\x44') == 0x1002
+        assert ram1.diff(ram2) == []
+
+        # expected data past end of memory
+        ram3 = wb.WBRam(64)
+        assert ram3.compare(56, bytes(8)) is None
+        assert ram3.compare(60, bytes(8)) == 64
+        assert ram3.compare(56, b'\x00\x01'+bytes(10)) == 57
+
+        # image past end of memory
+        ram4 = wb.WBRam(16)
+        assert ram4.diff(bytes(16)+b'\xff'*8) == [(16, 24)]
+        assert ram4.diff(b'\x00\x01'+bytes(14)+b'\xff'*8) == [(1, 2), (16, 24)]
+        assert ram4.diff(bytes(15)+b'\x01'+b'\xff'*8) == [(15, 24)]
+
+        ram1.write_mem(0x2000, b'\xff\xff')
+        ram2.write_mem(0x2001, b'\x01')
+        ram2.write_mem(0x8fffe, b'\x01'*4)
+
+        assert ram1.compare(0, ram2.read_mem(0, 2**20)) == 0x2000
+        assert ram1.diff(ram2) == [(0x2000, 0x2002), (0x8fffe, 0x90002)]
+        assert ram1.diff(ram2.read_mem(0x2000, 16), 0x2000) == [(0x2000, 0x2002)]
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 11: conflict policy set after port creation")
+        current_test.next = 11
+
+        wb_ram_inst.conflict = 'arbitrated'
+
+        yield clk.posedge
+        port0_adr_i.next = 0x4000
+        port0_dat_i.next = 0x44332211
+        port0_sel_i.next = 0xF
+        port0_we_i.next = 1
+
+        port0_cyc_i.next = 1
+        port0_stb_i.next = 1
+
+        yield port0_ack_o.posedge
+        yield clk.posedge
+        port0_we_i.next = 0
+        port0_cyc_i.next = 0
+        port0_stb_i.next = 0
+
+        assert wb_ram_inst.read_mem(0x4000, 4) == b'\x11\x22\x33\x44'
+        assert not wb_ram_inst.pending_access
+
+        wb_ram_inst.conflict = None
+
+        yield delay(100)
+
         raise StopSimulation
 
     return instances()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2015-2016 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+from myhdl import *
+import os
+
+import wb
+
+def bench():
+
+    # Inputs
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+    current_test = Signal(intbv(0)[8:])
+
+    port0_adr_i = Signal(intbv(0)[32:])
+    port0_dat_i = Signal(intbv(0)[32:])
+    port0_we_i = Signal(bool(0))
+    port0_sel_i = Signal(intbv(0)[4:])
+    port0_stb_i = Signal(bool(0))
+    port0_cyc_i = Signal(bool(0))
+
+    port1_adr_i = Signal(intbv(0)[32:])
+    port1_dat_i = Signal(intbv(0)[32:])
+    port1_we_i = Signal(bool(0))
+    port1_sel_i = Signal(intbv(0)[4:])
+    port1_stb_i = Signal(bool(0))
+    port1_cyc_i = Signal(bool(0))
+
+    # Outputs
+    port0_dat_o = Signal(intbv(0)[32:])
+    port0_ack_o = Signal(bool(0))
+
+    port1_dat_o = Signal(intbv(0)[32:])
+    port1_ack_o = Signal(bool(0))
+
+    # WB RAM model
+    wb_ram_inst = wb.WBRam(2**16, conflict='read-first')
+
+    wb_ram_port0 = wb_ram_inst.create_port(
+        clk,
+        adr_i=port0_adr_i,
+        dat_i=port0_dat_i,
+        dat_o=port0_dat_o,
+        we_i=port0_we_i,
+        sel_i=port0_sel_i,
+        stb_i=port0_stb_i,
+        ack_o=port0_ack_o,
+        cyc_i=port0_cyc_i,
+        latency=1,
+        asynchronous=False,
+        name='port0'
+    )
+
+    wb_ram_port1 = wb_ram_inst.create_port(
+        clk,
+        adr_i=port1_adr_i,
+        dat_i=port1_dat_i,
+        dat_o=port1_dat_o,
+        we_i=port1_we_i,
+        sel_i=port1_sel_i,
+        stb_i=port1_stb_i,
+        ack_o=port1_ack_o,
+        cyc_i=port1_cyc_i,
+        latency=1,
+        asynchronous=False,
+        name='port1'
+    )
+
+    @always(delay(4))
+    def clkgen():
+        clk.next = not clk
+
+    @instance
+    def check():
+        yield delay(100)
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+        yield delay(100)
+        yield clk.posedge
+
+        # port 0 writes while port 1 reads the same address in the same cycle
+        for test, policy, expect in [(1, 'read-first', b'\xaa\xaa\xaa\xaa'),
+                (2, 'write-first', b'\x11\x22\x33\x44'),
+                (3, 'arbitrated', b'\x11\x22\x33\x44')]:
+            yield clk.posedge
+            print("test %d: same cycle write and read, %s" % (test, policy))
+            current_test.next = test
+
+            wb_ram_inst.conflict = policy
+            wb_ram_inst.write_mem(0x10, b'\xaa\xaa\xaa\xaa')
+
+            yield clk.posedge
+            port0_adr_i.next = 0x10
+            port0_dat_i.next = 0x44332211
+            port0_sel_i.next = 0xF
+            port0_we_i.next = 1
+            port0_cyc_i.next = 1
+            port0_stb_i.next = 1
+
+            port1_adr_i.next = 0x10
+            port1_we_i.next = 0
+            port1_cyc_i.next = 1
+            port1_stb_i.next = 1
+
+            yield port0_ack_o.posedge
+            assert port1_ack_o
+            yield clk.posedge
+            port0_we_i.next = 0
+            port0_cyc_i.next = 0
+            port0_stb_i.next = 0
+            port1_cyc_i.next = 0
+            port1_stb_i.next = 0
+
+            assert int(port1_dat_o).to_bytes(4, 'little') == expect
+            assert wb_ram_inst.read_mem(0x10, 4) == b'\x11\x22\x33\x44'
+
+            yield delay(100)
+
+        yield clk.posedge
+        print("test 4: arbitrated, port 1 reads before write")
+        current_test.next = 4
+
+        # port 1 writes, port 0 reads; port 0 is applied first
+        wb_ram_inst.conflict = 'arbitrated'
+        wb_ram_inst.write_mem(0x20, b'\xaa\xaa\xaa\xaa')
+
+        yield clk.posedge
+        port0_adr_i.next = 0x20
+        port0_we_i.next = 0
+        port0_cyc_i.next = 1
+        port0_stb_i.next = 1
+
+        port1_adr_i.next = 0x20
+        port1_dat_i.next = 0x88776655
+        port1_sel_i.next = 0xF
+        port1_we_i.next = 1
+        port1_cyc_i.next = 1
+        port1_stb_i.next = 1
+
+        yield port0_ack_o.posedge
+        yield clk.posedge
+        port0_cyc_i.next = 0
+        port0_stb_i.next = 0
+        port1_we_i.next = 0
+        port1_cyc_i.next = 0
+        port1_stb_i.next = 0
+
+        assert int(port0_dat_o) == 0xaaaaaaaa
+        assert wb_ram_inst.read_mem(0x20, 4) == b'\x55\x66\x77\x88'
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 5: overlapping writes")
+        current_test.next = 5
+
+        # writes are applied in port order, so port 1 wins
+        yield clk.posedge
+        port0_adr_i.next = 0x30
+        port0_dat_i.next = 0x11111111
+        port0_sel_i.next = 0xF
+        port0_we_i.next = 1
+        port0_cyc_i.next = 1
+        port0_stb_i.next = 1
+
+        port1_adr_i.next = 0x30
+        port1_dat_i.next = 0x22220000
+        port1_sel_i.next = 0xC
+        port1_we_i.next = 1
+        port1_cyc_i.next = 1
+        port1_stb_i.next = 1
+
+        yield port0_ack_o.posedge
+        yield clk.posedge
+        port0_we_i.next = 0
+        port0_cyc_i.next = 0
+        port0_stb_i.next = 0
+        port1_we_i.next = 0
+        port1_cyc_i.next = 0
+        port1_stb_i.next = 0
+
+        assert wb_ram_inst.read_mem(0x30, 4) == b'\x11\x11\x22\x22'
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 6: port statistics")
+        current_test.next = 6
+
+        print(wb_ram_inst.port_stats)
+
+        assert wb_ram_inst.port_stats[0] == {'reads': 1, 'writes': 4, 'conflicts': 5}
+        assert wb_ram_inst.port_stats[1] == {'reads': 3, 'writes': 2, 'conflicts': 5}
+
+        yield delay(100)
+
+        raise StopSimulation
+
+    return instances()
+
+def test_bench():
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sim = Simulation(bench())
+    sim.run()
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_bench()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2015-2016 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+from myhdl import *
+import os
+
+import wb
+
+def bench():
+
+    # Inputs
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+    current_test = Signal(intbv(0)[8:])
+
+    # WB RAM model
+    wb_ram_inst = wb.WBRam(2**16)
+
+    # WB master, bound directly to RAM model
+    wb_master_inst = wb.WBMaster()
+
+    wb_master_logic = wb_master_inst.create_tlm_logic(
+        clk,
+        wb_ram_inst,
+        width=32,
+        latency=2,
+        cycles_per_beat=1
+    )
+
+    @always(delay(4))
+    def clkgen():
+        clk.next = not clk
+
+    @instance
+    def check():
+        yield delay(100)
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+        yield delay(100)
+        yield clk.posedge
+
+        yield clk.posedge
+        print("test 1: write")
+        current_test.next = 1
+
+        wb_master_inst.init_write(4, b'\x11\x22\x33\x44')
+
+        yield wb_master_inst.wait()
+        yield clk.posedge
+
+        assert wb_ram_inst.read_mem(4,4) == b'\x11\x22\x33\x44'
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 2: read")
+        current_test.next = 2
+
+        wb_master_inst.init_read(4, 4)
+
+        yield wb_master_inst.wait()
+        yield clk.posedge
+
+        data = wb_master_inst.get_read_data()
+        assert data[0] == 4
+        assert data[1] == b'\x11\x22\x33\x44'
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 3: timing")
+        current_test.next = 3
+
+        # latency + one cycle per beat
+        txn = wb_master_inst.init_write(0x1000+2, bytearray(range(16)))
+        yield txn.wait()
+        assert txn.end_time - txn.start_time == 8*(2+5)
+
+        txn = wb_master_inst.init_read(0x1000, 16)
+        yield txn.wait()
+        assert txn.end_time - txn.start_time == 8*(2+4)
+        assert txn.data == bytearray(2) + bytearray(range(14))
+
+        wb_master_inst.get_read_data_bulk()
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 4: many accesses")
+        current_test.next = 4
+
+        start = now()
+
+        cmds = []
+        for k in range(10000):
+            cmds.append(('w', 0x2000+(k % 1024)*4, bytearray([k & 0xff]*4)))
+            cmds.append(('r', 0x2000+(k % 1024)*4, 4))
+
+        txns = wb_master_inst.init_bulk(cmds)
+
+        yield txns[-1].wait()
+
+        assert now() - start >= 8*10000*2*(2+1)
+
+        data = wb_master_inst.get_read_data_bulk()
+        assert len(data) == 10000
+        for k in range(10000):
+            assert data[k][1] == bytearray([k & 0xff]*4)
+
+        buf = bytearray(16)
+        txn = wb_master_inst.init_read_into(0x2000, buf)
+        yield txn.wait()
+        assert buf == wb_ram_inst.read_mem(0x2000, 16)
+
+        yield delay(100)
+
+        raise StopSimulation
+
+    return instances()
+
+def test_bench():
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sim = Simulation(bench())
+    sim.run()
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_bench()
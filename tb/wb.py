@@ -23,48 +23,329 @@ THE SOFTWARE.
 """
 
 from myhdl import *
+import array
 import mmap
+import bisect
+import os
+import struct
+import random
+import shutil
+import sys
+from collections import deque
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# array type codes by word size
+array_types = {}
+for t in 'BHILQ':
+    array_types.setdefault(array.array(t).itemsize, t)
+
+def pack_words(words, ws=2, byteorder='little'):
+    # pack sequence of integer words into bytes
+    if numpy is not None and isinstance(words, numpy.ndarray) and ws in (1, 2, 4, 8):
+        return words.astype(numpy.dtype('%su%d' % ('<' if byteorder == 'little' else '>', ws))).tobytes()
+    if ws in array_types:
+        try:
+            a = array.array(array_types[ws], words)
+        except OverflowError:
+            # truncate out of range values
+            mask = 2**(ws*8)-1
+            a = array.array(array_types[ws], (w & mask for w in words))
+        if byteorder != sys.byteorder:
+            a.byteswap()
+        return a.tobytes()
+    # wide words
+    mask = 2**(ws*8)-1
+    return b''.join((w & mask).to_bytes(ws, byteorder) for w in words)
+
+def unpack_words(data, ws=2, byteorder='little'):
+    # unpack bytes into list of integer words, trailing partial word is dropped
+    mv = memoryview(data).cast('B')
+    mv = mv[:len(mv) - len(mv) % ws]
+    if ws in array_types:
+        a = array.array(array_types[ws])
+        a.frombytes(mv)
+        if byteorder != sys.byteorder:
+            a.byteswap()
+        return a.tolist()
+    # wide words
+    return [int.from_bytes(mv[i:i+ws], byteorder) for i in range(0, len(mv), ws)]
+
+def sel_runs(sel, ww):
+    # (first, last+1) lane indices of each run of set select bits
+    i = 0
+    while i < ww:
+        if sel & (1 << i):
+            j = i
+            while j < ww and sel & (1 << j):
+                j += 1
+            yield i, j
+            i = j
+        else:
+            i += 1
+
+
+def diff_ranges(a, b, offset=0):
+    # list of (start, end) ranges where equal length byte strings differ
+    if numpy is not None:
+        d = numpy.flatnonzero(numpy.frombuffer(a, dtype=numpy.uint8) != numpy.frombuffer(b, dtype=numpy.uint8))
+        if not len(d):
+            return []
+        brk = numpy.flatnonzero(numpy.diff(d) > 1)
+        starts = numpy.concatenate(([d[0]], d[brk+1]))
+        ends = numpy.concatenate((d[brk], [d[-1]])) + 1
+        return [(int(s)+offset, int(e)+offset) for s, e in zip(starts, ends)]
+
+    # bisect down to small blocks with memcmp, then compare bytes
+    ranges = []
+    stack = [(0, len(a))]
+    while stack:
+        lo, hi = stack.pop()
+        if a[lo:hi] == b[lo:hi]:
+            continue
+        if hi - lo > 64:
+            mid = (lo + hi) // 2
+            stack.append((mid, hi))
+            stack.append((lo, mid))
+            continue
+        for i in range(lo, hi):
+            if a[i] != b[i]:
+                if ranges and ranges[-1][1] == i+offset:
+                    ranges[-1] = (ranges[-1][0], i+offset+1)
+                else:
+                    ranges.append((i+offset, i+offset+1))
+    return ranges
+
+
+class WBStats(object):
+    def __init__(self):
+        # clock period, set by master logic
+        self.period = None
+        self.count = 0
+        self.bytes = 0
+        self.read_bytes = 0
+        self.write_bytes = 0
+        self.wait_states = 0
+        self.start_time = None
+        self.end_time = None
+        # per command times in simulation time units
+        self.queue_time = array.array('Q')      # issue to start of bus cycle
+        self.latency = array.array('Q')         # start of bus cycle to first ack
+        self.duration = array.array('Q')        # start of bus cycle to completion
+
+    def record(self, txn):
+        self.count += 1
+        self.bytes += txn.length
+        if txn.op == 'r':
+            self.read_bytes += txn.length
+        else:
+            self.write_bytes += txn.length
+        self.wait_states += txn.wait_states
+        if self.start_time is None:
+            self.start_time = txn.start_time
+        self.end_time = txn.end_time
+        self.queue_time.append(txn.start_time - txn.issue_time)
+        self.latency.append(txn.first_ack_time - txn.start_time)
+        self.duration.append(txn.end_time - txn.start_time)
+
+    def reset(self):
+        period = self.period
+        self.__init__()
+        self.period = period
+
+    def cycles(self, t):
+        if not self.period:
+            return t
+        return int(round(t / float(self.period)))
+
+    def percentile(self, p, which='latency'):
+        # nearest rank percentile in clock cycles
+        a = sorted(getattr(self, which))
+        if not a:
+            return None
+        return self.cycles(a[min(len(a)-1, max(0, int(-(-p*len(a)//100))-1))])
+
+    def histogram(self, which='latency'):
+        # number of commands by cycle count
+        h = {}
+        for t in getattr(self, which):
+            c = self.cycles(t)
+            h[c] = h.get(c, 0) + 1
+        return h
+
+    def bytes_per_cycle(self):
+        if not self.count:
+            return 0.0
+        c = self.cycles(self.end_time - self.start_time)
+        if not c:
+            return 0.0
+        return self.bytes / float(c)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'bytes': self.bytes,
+            'read_bytes': self.read_bytes,
+            'write_bytes': self.write_bytes,
+            'wait_states': self.wait_states,
+            'bytes_per_cycle': self.bytes_per_cycle(),
+            'latency_p50': self.percentile(50),
+            'latency_p99': self.percentile(99),
+            'duration_p50': self.percentile(50, 'duration'),
+            'duration_p99': self.percentile(99, 'duration')
+        }
+
+    def __repr__(self):
+        return 'WBStats(%s)' % ', '.join('%s=%s' % (k, repr(v)) for k, v in sorted(self.summary().items()))
+
+
+class WBTransaction(object):
+    __slots__ = ('op', 'address', 'data', 'length', 'bte', 'lock', 'locked',
+        'completed', 'done_signal', 'issue_time', 'start_time', 'first_ack_time',
+        'end_time', 'wait_states')
+
+    def __init__(self, op, address, data=None, length=None, bte=0):
+        self.op = op
+        self.address = address
+        self.data = data
+        self.length = length
+        self.bte = bte
+        # hold cycle open for next command (locked sequence)
+        self.lock = False
+        # part of locked sequence, drives lock_o
+        self.locked = False
+        # completion flag, signal for txn.done is only created when requested
+        self.completed = False
+        self.done_signal = None
+        self.issue_time = now()
+        self.start_time = None
+        self.first_ack_time = None
+        self.end_time = None
+        self.wait_states = 0
+
+    def complete(self, data=None):
+        if data is not None:
+            self.data = data
+        self.end_time = now()
+        if self.first_ack_time is None:
+            self.first_ack_time = self.end_time
+        self.completed = True
+        if self.done_signal is not None:
+            self.done_signal.next = True
+
+    @property
+    def done(self):
+        # completion event, yield txn.done.posedge or txn.wait()
+        if self.done_signal is None:
+            self.done_signal = Signal(bool(self.completed))
+        return self.done_signal
+
+    def wait(self):
+        if not self.completed:
+            yield self.done.posedge
+
+    def __repr__(self):
+        return (
+                ('WBTransaction(op=%s, ' % repr(self.op)) +
+                ('address=0x%08x, ' % self.address) +
+                ('length=%d, ' % self.length) +
+                ('done=%s)' % repr(self.completed))
+            )
+
 
 class WBMaster(object):
     def __init__(self):
-        self.command_queue = []
-        self.read_data_queue = []
+        self.command_queue = deque()
+        self.read_data_queue = deque()
         self.has_logic = False
         self.clk = None
         self.cyc_o = None
-
-    def init_read(self, address, length):
-        self.command_queue.append(('r', address, length))
+        self.bus_width = None
+        self.burst = False
+        self.stats = WBStats()
+
+    def check_bte(self, address, length, bte):
+        # validate wrapping burst when the command is issued
+        if bte not in (0, 1, 2, 3):
+            raise Exception("Invalid burst type extension")
+        if bte and self.has_logic:
+            if not self.burst:
+                raise Exception("Wrapping burst requires burst mode")
+            bw = self.bus_width
+            if address % bw or (length + bw-1) // bw > 4 << (bte-1):
+                raise Exception("Wrapping burst must be bus aligned and fit in the wrap block")
+
+    def init_read(self, address, length, bte=0):
+        self.check_bte(address, length, bte)
+        txn = WBTransaction('r', address, length=length, bte=bte)
+        self.command_queue.append(txn)
+        return txn
+
+    def init_read_into(self, address, buffer, bte=0):
+        # read directly into a writable buffer (bytearray, memoryview, array, mmap, ...)
+        # result is not queued in read_data_queue
+        mv = memoryview(buffer).cast('B')
+        self.check_bte(address, len(mv), bte)
+        txn = WBTransaction('r', address, data=mv, length=len(mv), bte=bte)
+        self.command_queue.append(txn)
+        return txn
 
     def init_read_words(self, address, length, ws=2):
-        assert ws in (1, 2, 4, 8)
-        self.init_read(int(address*ws), int(length*ws))
+        assert ws > 0
+        return self.init_read(int(address*ws), int(length*ws))
 
     def init_read_dwords(self, address, length):
-        self.init_read_words(address, length, 4)
+        return self.init_read_words(address, length, 4)
 
     def init_read_qwords(self, address, length):
-        self.init_read_words(address, length, 8)
+        return self.init_read_words(address, length, 8)
 
-    def init_write(self, address, data):
-        self.command_queue.append(('w', address, data))
+    def init_write(self, address, data, bte=0):
+        self.check_bte(address, len(data), bte)
+        txn = WBTransaction('w', address, data=data, length=len(data), bte=bte)
+        self.command_queue.append(txn)
+        return txn
 
-    def init_write_words(self, address, data, ws=2):
-        assert ws in (1, 2, 4, 8)
-        data2 = []
-        for w in data:
-            d = []
-            for j in range(ws):
-                d.append(w&0xff)
-                w >>= 8
-            data2.extend(bytearray(d))
-        self.init_write(int(address*ws), data2)
+    def init_write_words(self, address, data, ws=2, byteorder='little'):
+        assert ws > 0
+        return self.init_write(int(address*ws), pack_words(data, ws, byteorder))
 
     def init_write_dwords(self, address, data):
-        self.init_write_words(address, data, 4)
+        return self.init_write_words(address, data, 4)
 
     def init_write_qwords(self, address, data):
-        self.init_write_words(address, data, 8)
+        return self.init_write_words(address, data, 8)
+
+    def init_bulk(self, commands):
+        # commands: iterable of ('r', address, length[, bte]) or ('w', address, data[, bte])
+        txns = []
+        append = txns.append
+        for cmd in commands:
+            bte = cmd[3] if len(cmd) > 3 else 0
+            if cmd[0] == 'r':
+                if bte:
+                    self.check_bte(cmd[1], cmd[2], bte)
+                append(WBTransaction('r', cmd[1], None, cmd[2], bte))
+            elif cmd[0] == 'w':
+                if bte:
+                    self.check_bte(cmd[1], len(cmd[2]), bte)
+                append(WBTransaction('w', cmd[1], cmd[2], len(cmd[2]), bte))
+            else:
+                raise Exception("Invalid command")
+        self.command_queue.extend(txns)
+        return txns
+
+    def init_locked(self, commands):
+        # run commands back to back in a single locked bus cycle
+        txns = self.init_bulk(commands)
+        for txn in txns:
+            txn.locked = True
+        for txn in txns[:-1]:
+            txn.lock = True
+        return txns
 
     def idle(self):
         return len(self.command_queue) == 0 and not self.cyc_o.next
@@ -77,22 +358,22 @@ class WBMaster(object):
         return not self.read_data_queue
 
     def get_read_data(self):
-        return self.read_data_queue.pop(0)
+        return self.read_data_queue.popleft()
 
-    def get_read_data_words(self, ws=2):
-        assert ws in (1, 2, 4, 8)
+    def get_read_data_bulk(self, count=-1):
+        if count < 0 or count >= len(self.read_data_queue):
+            data = list(self.read_data_queue)
+            self.read_data_queue.clear()
+            return data
+        return [self.read_data_queue.popleft() for i in range(count)]
+
+    def get_read_data_words(self, ws=2, byteorder='little'):
+        assert ws > 0
         v = self.get_read_data()
         if v is None:
             return None
         address, data = v
-        d = []
-        for i in range(int(len(data)/ws)):
-            w = 0
-            for j in range(ws-1,-1,-1):
-                w <<= 8
-                w += data[i*ws+j]
-            d.append(w)
-        return (int(address/ws), d)
+        return (int(address/ws), unpack_words(data, ws, byteorder))
 
     def get_read_data_dwords(self):
         return self.get_read_data_words(4)
@@ -110,6 +391,14 @@ class WBMaster(object):
                 stb_o=Signal(bool(0)),
                 ack_i=Signal(bool(0)),
                 cyc_o=Signal(bool(0)),
+                stall_i=Signal(bool(0)),
+                cti_o=Signal(intbv(0)[3:]),
+                bte_o=Signal(intbv(0)[2:]),
+                lock_o=Signal(bool(0)),
+                pipelined=False,
+                max_outstanding=4,
+                burst=False,
+                keep_cyc=False,
                 name=None
             ):
 
@@ -132,211 +421,921 @@ class WBMaster(object):
         assert ww in (1, 2, 4, 8)
         assert ws in (1, 2, 4, 8)
 
+        assert max_outstanding >= 1
+        assert not (pipelined and burst)
+
         self.has_logic = True
         self.clk = clk
         self.cyc_o = cyc_o
+        # wrapping bursts (bte) are only signalled in classic burst mode
+        self.bus_width = bw
+        self.burst = burst
 
         @instance
-        def logic():
-            while True:
-                yield clk.posedge
+        def measure_period():
+            yield clk.posedge
+            t = now()
+            yield clk.posedge
+            self.stats.period = now() - t
+
+        def burst_address(adr, k, bte):
+            # address of beat k of a burst starting at adr
+            # bte 0: linear, 1: 4-beat wrap, 2: 8-beat wrap, 3: 16-beat wrap
+            if bte:
+                blk = (4 << (bte-1))*ww
+                return adr - adr % blk + (adr % blk + k*ww) % blk
+            return adr + k*ww
+
+        def beat_plan(cmd):
+            # convert command into list of (address, select, data) beats
+            addr = cmd.address
+            length = cmd.length
+            # address in words
+            adw = int(addr/ws)
+            # select for first access
+            sel_start = ((2**(ww)-1) << int(adw % ww)) & (2**(ww)-1)
+            # select for last access
+            sel_end = (2**(ww)-1) >> int(ww - (((int((addr+length-1)/ws)) % ww) + 1))
+            # number of cycles
+            cycles = int((length + bw-1 + (addr % bw)) / bw)
+
+            if cmd.bte:
+                assert addr % bw == 0 and cycles <= 4 << (cmd.bte-1)
+
+            if cmd.op == 'w':
+                # align write data to bus lanes
+                offset = addr % bw
+                buf = bytearray(offset) + bytearray(cmd.data) + bytearray(cycles*bw - offset - length)
+                mv = memoryview(buf)
+
+            beats = []
+            for k in range(cycles):
+                sel = 2**(ww)-1
+                if k == 0:
+                    sel &= sel_start
+                if k == cycles-1:
+                    sel &= sel_end
+                if cmd.op == 'w':
+                    val = int.from_bytes(mv[k*bw:(k+1)*bw], 'little')
+                else:
+                    val = 0
+                beats.append((burst_address(int(adw/ww)*ww, k, cmd.bte), sel, val))
+
+            return beats
+
+        if pipelined:
+            # pipelined mode (Wishbone B4)
+            # a new request is presented on every cycle that stall_i is low
+            # and fewer than max_outstanding requests are awaiting ack_i
+            @instance
+            def logic():
+                cmd = None          # command being presented
+                k = 0               # next beat to present
+                active = False      # request presented on bus
+                pending = deque()   # accepted requests awaiting ack
+                cyc = False         # bus cycle open
+                hold = False        # keep bus cycle open for next command
+
+                while True:
+                    if not active:
+                        if cmd is not None and len(pending) < max_outstanding:
+                            # present next request
+                            adr, sel, val = beats[k]
+                            stb_o.next = 1
+                            we_o.next = write
+                            adr_o.next = adr
+                            sel_o.next = sel
+                            if write:
+                                dat_o.next = val
+                            active = True
+                        else:
+                            stb_o.next = 0
+                            we_o.next = 0
 
-                # check for commands
-                if len(self.command_queue) > 0:
-                    cmd = self.command_queue.pop(0)
+                    yield clk.posedge
 
-                    # address
-                    addr = cmd[1]
-                    # address in words
-                    adw = int(addr/ws)
-                    # select for first access
-                    sel_start = ((2**(ww)-1) << int(adw % ww)) & (2**(ww)-1)
-
-                    if cmd[0] == 'w':
-                        data = cmd[2]
-                        # select for last access
-                        sel_end = (2**(ww)-1) >> int(ww - (((int((addr+len(data)-1)/ws)) % ww) + 1))
-                        # number of cycles
-                        cycles = int((len(data) + bw-1 + (addr % bw)) / bw)
-                        i = 0
+                    if pending and not int(ack_i):
+                        pending[0][0].wait_states += 1
 
-                        if name is not None:
-                            print("[%s] Write data a:0x%08x d:%s" % (name, addr, " ".join(("{:02x}".format(c) for c in bytearray(data)))))
+                    if active:
+                        if int(stall_i):
+                            cmd.wait_states += 1
+                        else:
+                            # request accepted
+                            pending.append((cmd, data, k, len(beats)))
+                            k += 1
+                            active = False
+                            if k == len(beats):
+                                cmd = None
+
+                    if int(ack_i) and pending:
+                        # match ack with oldest outstanding request
+                        c, d, n, cycles = pending.popleft()
+
+                        if n == 0:
+                            c.first_ack_time = now()
+
+                        if c.op == 'r':
+                            lane_start = c.address % bw
+                            lo = lane_start if n == 0 else 0
+                            hi = ((c.address + c.length - 1) % bw) + 1 if n == cycles-1 else bw
+                            j = n*bw - lane_start + lo
+                            d[j:j+hi-lo] = int(dat_i).to_bytes(bw, 'little')[lo:hi]
+
+                        if n == cycles-1:
+                            # last beat of command
+                            if c.op == 'w' or c.data is not None:
+                                c.complete()
+                            else:
+                                d = d.tobytes()
 
-                        cyc_o.next = 1
+                                if name is not None:
+                                    print("[%s] Read data a:0x%08x d:%s" % (name, c.address, " ".join(("{:02x}".format(x) for x in bytearray(d)))))
 
-                        # first cycle
-                        stb_o.next = 1
-                        we_o.next = 1
-                        adr_o.next = int(adw/ww)*ww
-                        val = 0
-                        for j in range(bw):
-                            if j >= addr % bw and (cycles > 1 or j < (((addr + len(data) - 1) % bw) + 1)):
-                                val |= bytearray(data)[i] << j*8
-                                i += 1
-                        dat_o.next = val
-
-                        if cycles == 1:
-                            sel_o.next = sel_start & sel_end
-                        else:
-                            sel_o.next = sel_start
+                                self.read_data_queue.append((c.address, d))
+                                c.complete(d)
 
-                        yield clk.posedge
-                        while not int(ack_i):
-                            yield clk.posedge
+                            self.stats.record(c)
 
+                    if cyc and cmd is None and not pending and not (hold and len(self.command_queue) > 0):
+                        # end of bus cycle
                         stb_o.next = 0
                         we_o.next = 0
+                        cyc_o.next = 0
+                        lock_o.next = 0
+                        cyc = False
+                        hold = False
+
+                    elif cmd is None and len(self.command_queue) > 0 and (hold or not cyc):
+                        # start next command, overlapping with outstanding
+                        # requests of previous command when cycle is held open
+                        cmd = self.command_queue.popleft()
+                        write = cmd.op == 'w'
+                        beats = beat_plan(cmd)
+                        k = 0
+
+                        if write:
+                            data = None
+                            if name is not None:
+                                print("[%s] Write data a:0x%08x d:%s" % (name, cmd.address, " ".join(("{:02x}".format(c) for c in bytearray(cmd.data)))))
+                        elif cmd.data is not None:
+                            # read into caller supplied buffer
+                            data = cmd.data
+                        else:
+                            data = memoryview(bytearray(cmd.length))
 
-                        for k in range(1, cycles-1):
-                            # middle cycles
-                            yield clk.posedge
-                            stb_o.next = 1
-                            we_o.next = 1
-                            adr_o.next = int(adw/ww)*ww + k * ww
-                            val = 0
-                            for j in range(bw):
-                                val |= bytearray(data)[i] << j*8
-                                i += 1
-                            dat_o.next = val
-                            sel_o.next = 2**(ww)-1
+                        cyc_o.next = 1
+                        lock_o.next = cmd.locked
+                        cmd.start_time = now()
+                        cyc = True
+                        hold = keep_cyc or cmd.lock
 
-                            yield clk.posedge
-                            while not int(ack_i):
-                                yield clk.posedge
+            return instances()
 
-                            stb_o.next = 0
-                            we_o.next = 0
+        @instance
+        def logic():
+            cmd = None
 
-                        if cycles > 1:
-                            # last cycle
-                            yield clk.posedge
-                            stb_o.next = 1
-                            we_o.next = 1
-                            adr_o.next = int(adw/ww)*ww + (cycles-1) * ww
-                            val = 0
-                            for j in range(bw):
-                                if j < (((addr + len(data) - 1) % bw) + 1):
-                                    val |= bytearray(data)[i] << j*8
-                                    i += 1
+            while True:
+                if cmd is None:
+                    yield clk.posedge
+
+                    # check for commands
+                    if len(self.command_queue) > 0:
+                        cmd = self.command_queue.popleft()
+
+                if cmd is not None:
+                    # address
+                    addr = cmd.address
+                    length = cmd.length
+                    write = cmd.op == 'w'
+                    beats = beat_plan(cmd)
+                    cycles = len(beats)
+                    # byte lanes used in first and last cycles
+                    lane_start = addr % bw
+                    lane_end = ((addr + length - 1) % bw) + 1
+                    # incrementing or wrapping burst
+                    in_burst = burst and cycles > 1
+
+                    if write:
+                        if name is not None:
+                            print("[%s] Write data a:0x%08x d:%s" % (name, addr, " ".join(("{:02x}".format(c) for c in bytearray(cmd.data)))))
+                    elif cmd.data is not None:
+                        # read into caller supplied buffer
+                        data = cmd.data
+                    else:
+                        data = memoryview(bytearray(length))
+
+                    cyc_o.next = 1
+                    lock_o.next = cmd.locked
+                    cmd.start_time = now()
+
+                    if in_burst:
+                        cti_o.next = 0b010
+                        bte_o.next = cmd.bte
+
+                    for k in range(cycles):
+                        adr, sel, val = beats[k]
+
+                        if k > 0:
+                            if not in_burst:
+                                yield clk.posedge
+                            elif k == cycles-1:
+                                # last cycle
+                                cti_o.next = 0b111
+
+                        stb_o.next = 1
+                        we_o.next = write
+                        adr_o.next = adr
+                        sel_o.next = sel
+                        if write:
                             dat_o.next = val
-                            sel_o.next = sel_end
 
+                        yield clk.posedge
+                        while not int(ack_i):
+                            cmd.wait_states += 1
                             yield clk.posedge
-                            while not int(ack_i):
-                                yield clk.posedge
 
+                        if k == 0:
+                            cmd.first_ack_time = now()
+
+                        if not in_burst:
                             stb_o.next = 0
                             we_o.next = 0
 
-                        we_o.next = 0
-                        stb_o.next = 0
+                        if not write:
+                            lo = lane_start if k == 0 else 0
+                            hi = lane_end if k == cycles-1 else bw
+                            j = k*bw - lane_start + lo
+                            data[j:j+hi-lo] = int(dat_i).to_bytes(bw, 'little')[lo:hi]
+
+                    we_o.next = 0
+                    stb_o.next = 0
+                    cti_o.next = 0
+                    bte_o.next = 0
 
+                    if (keep_cyc or cmd.lock) and len(self.command_queue) > 0:
+                        # keep cycle open and start next command on this edge
+                        nxt = self.command_queue.popleft()
+                    else:
+                        nxt = None
                         cyc_o.next = 0
+                        lock_o.next = 0
 
-                    elif cmd[0] == 'r':
-                        length = cmd[2]
-                        data = b''
-                        # select for last access
-                        sel_end = (2**(ww)-1) >> int(ww - (((int((addr+length-1)/ws)) % ww) + 1))
-                        # number of cycles
-                        cycles = int((length + bw-1 + (addr % bw)) / bw)
+                    if write:
+                        cmd.complete()
+                    elif cmd.data is not None:
+                        cmd.complete()
+                    else:
+                        data = data.tobytes()
 
-                        cyc_o.next = 1
+                        if name is not None:
+                            print("[%s] Read data a:0x%08x d:%s" % (name, addr, " ".join(("{:02x}".format(c) for c in bytearray(data)))))
 
-                        # first cycle
-                        stb_o.next = 1
-                        adr_o.next = int(adw/ww)*ww
-                        if cycles == 1:
-                            sel_o.next = sel_start & sel_end
-                        else:
-                            sel_o.next = sel_start
+                        self.read_data_queue.append((addr, data))
+                        cmd.complete(data)
 
-                        yield clk.posedge
-                        while not int(ack_i):
-                            yield clk.posedge
+                    self.stats.record(cmd)
 
-                        stb_o.next = 0
+                    cmd = nxt
 
-                        val = int(dat_i)
+        return instances()
 
-                        for j in range(bw):
-                            if j >= addr % bw and (cycles > 1 or j < (((addr + length - 1) % bw) + 1)):
-                                data += bytes(bytearray([(val >> j*8) & 255]))
+    def create_tlm_logic(self,
+                clk,
+                slave,
+                width=32,
+                latency=1,
+                cycles_per_beat=1,
+                name=None
+            ):
 
-                        for k in range(1, cycles-1):
-                            # middle cycles
-                            yield clk.posedge
-                            stb_o.next = 1
-                            adr_o.next = int(adw/ww)*ww + k * ww
-                            sel_o.next = 2**(ww)-1
+        # transaction level binding
+        # commands are passed directly to slave.tlm_read and slave.tlm_write,
+        # bus timing is modelled by advancing simulation time by the number of
+        # cycles the transfer would take, without driving any bus signals
 
-                            yield clk.posedge
-                            while not int(ack_i):
-                                yield clk.posedge
+        if self.has_logic:
+            raise Exception("Logic already instantiated!")
 
-                            stb_o.next = 0
+        assert width % 8 == 0
 
-                            val = int(dat_i)
+        bw = int(width/8)   # width of bus in bytes
 
-                            for j in range(bw):
-                                data += bytes(bytearray([(val >> j*8) & 255]))
+        self.has_logic = True
+        self.clk = clk
+        self.cyc_o = Signal(bool(0))
 
-                        if cycles > 1:
-                            # last cycle
-                            yield clk.posedge
-                            stb_o.next = 1
-                            adr_o.next = int(adw/ww)*ww + (cycles-1) * ww
-                            sel_o.next = sel_end
+        @instance
+        def logic():
+            # measure clock period
+            yield clk.posedge
+            t = now()
+            yield clk.posedge
+            period = now() - t
+            self.stats.period = period
 
-                            yield clk.posedge
-                            while not int(ack_i):
-                                yield clk.posedge
+            while True:
+                # check for commands
+                if len(self.command_queue) > 0:
+                    cmd = self.command_queue.popleft()
 
-                            stb_o.next = 0
+                    addr = cmd.address
+                    length = cmd.length
+                    # number of cycles
+                    cycles = latency + int((length + bw-1 + (addr % bw)) / bw) * cycles_per_beat
 
-                            val = int(dat_i)
+                    self.cyc_o.next = 1
+                    cmd.start_time = now()
 
-                            for j in range(bw):
-                                if j < (((addr + length - 1) % bw) + 1):
-                                    data += bytes(bytearray([(val >> j*8) & 255]))
+                    if cmd.op == 'w':
+                        if name is not None:
+                            print("[%s] Write data a:0x%08x d:%s" % (name, addr, " ".join(("{:02x}".format(c) for c in bytearray(cmd.data)))))
 
-                        stb_o.next = 0
-                        cyc_o.next = 0
+                        data = cmd.data
+                        if not isinstance(data, (bytes, bytearray, memoryview)):
+                            data = bytearray(data)
+                        slave.tlm_write(addr, data)
+                    else:
+                        data = slave.tlm_read(addr, length)
 
                         if name is not None:
                             print("[%s] Read data a:0x%08x d:%s" % (name, addr, " ".join(("{:02x}".format(c) for c in bytearray(data)))))
 
+                    # advance to clock edge at end of transfer
+                    yield delay(cycles*period - int(period/2))
+                    yield clk.posedge
+
+                    self.cyc_o.next = 0
+
+                    cmd.wait_states = latency
+                    cmd.first_ack_time = cmd.start_time + (latency+cycles_per_beat)*period
+
+                    if cmd.op == 'w':
+                        cmd.complete()
+                    elif cmd.data is not None:
+                        cmd.data[:] = data
+                        cmd.complete()
+                    else:
                         self.read_data_queue.append((addr, data))
+                        cmd.complete(data)
+
+                    self.stats.record(cmd)
+                else:
+                    yield clk.posedge
 
         return instances()
 
 
+class RandomLatency(object):
+    # latency drawn from values with optional relative weights
+    def __init__(self, values, weights=None, seed=None):
+        self.values = list(values)
+        self.rng = random.Random(seed)
+        self.cum_weights = None
+        if weights is not None:
+            assert len(weights) == len(self.values)
+            self.cum_weights = []
+            t = 0
+            for w in weights:
+                t += w
+                self.cum_weights.append(t)
+
+    def __call__(self, address, cycle):
+        if self.cum_weights is None:
+            return self.values[int(self.rng.random()*len(self.values))]
+        return self.values[bisect.bisect(self.cum_weights, self.rng.random()*self.cum_weights[-1])]
+
+
+class RegionLatency(object):
+    # latency by address region, regions: iterable of (start, end, latency)
+    def __init__(self, regions, default=1):
+        regions = sorted(regions)
+        self.starts = [r[0] for r in regions]
+        self.ends = [r[1] for r in regions]
+        self.latencies = [r[2] for r in regions]
+        self.default = default
+
+    def __call__(self, address, cycle):
+        i = bisect.bisect(self.starts, address) - 1
+        if i >= 0 and address < self.ends[i]:
+            lat = self.latencies[i]
+            if callable(lat):
+                return lat(address, cycle)
+            return lat
+        if callable(self.default):
+            return self.default(address, cycle)
+        return self.default
+
+
+class RefreshLatency(object):
+    # base latency, plus stall until end of refresh window
+    # refresh windows are duration cycles long and start every period cycles
+    def __init__(self, period, duration, base=1, offset=0):
+        self.period = period
+        self.duration = duration
+        self.base = base
+        self.offset = offset
+
+    def __call__(self, address, cycle):
+        if callable(self.base):
+            lat = self.base(address, cycle)
+        else:
+            lat = self.base
+        t = (cycle - self.offset) % self.period
+        if t < self.duration:
+            lat += self.duration - t
+        return lat
+
+
+class TraceLatency(object):
+    # latencies replayed in order from a file of whitespace separated integers
+    # or from an iterable, repeating from the start when exhausted
+    def __init__(self, trace, repeat=True):
+        if isinstance(trace, str):
+            with open(trace, 'r') as f:
+                trace = f.read().split()
+        self.trace = array.array('L', (int(x) for x in trace))
+        assert len(self.trace) > 0
+        self.repeat = repeat
+        self.index = 0
+
+    def __call__(self, address, cycle):
+        if self.index >= len(self.trace):
+            if not self.repeat:
+                return self.trace[-1]
+            self.index = 0
+        lat = self.trace[self.index]
+        self.index += 1
+        return lat
+
+
+class WBTrace(object):
+    # compact binary access trace
+    # each record is (time, port, address, sel, we, ws, data), with address in
+    # bytes, ws the word size in bytes and data covering the full bus width
+    # fixed fields are packed into one record buffer, data into a byte buffer
+    # file format: chunks of header (magic, record count, data length),
+    # packed records, data
+    header = struct.Struct('<4sII')
+    magic = b'WBT2'
+    # time, port, address, sel, flags (bit 0 we), ws, data length
+    record = struct.Struct('<QHQBBBH')
+    # original format, seven 64 bit words per record
+    magic_v1 = b'WBTR'
+    fields_v1 = 7
+
+    def __init__(self, filename=None, flush_size=65536):
+        self.records = bytearray()
+        self.data = bytearray()
+        self.filename = filename
+        self.flush_size = flush_size
+        if filename is not None:
+            open(filename, 'wb').close()
+
+    def append(self, time, port, address, sel, we, ws, data):
+        self.records.extend(self.record.pack(time, port, address, sel, int(bool(we)), ws, len(data)))
+        self.data.extend(data)
+        if self.filename is not None and len(self) >= self.flush_size:
+            self.flush()
+
+    def write_chunk(self, f):
+        f.write(self.header.pack(self.magic, len(self), len(self.data)))
+        f.write(self.records)
+        f.write(self.data)
+
+    def flush(self):
+        # move buffered records to trace file
+        if self.filename is None or not self.records:
+            return
+        with open(self.filename, 'ab') as f:
+            self.write_chunk(f)
+        self.records = bytearray()
+        self.data = bytearray()
+
+    def save(self, filename):
+        if self.filename is not None:
+            # streaming to file, flush and copy complete trace
+            self.flush()
+            if os.path.abspath(filename) != os.path.abspath(self.filename):
+                shutil.copyfile(self.filename, filename)
+            return
+        with open(filename, 'wb') as f:
+            self.write_chunk(f)
+
+    @classmethod
+    def load(cls, filename):
+        trace = cls()
+        with open(filename, 'rb') as f:
+            while True:
+                hdr = f.read(cls.header.size)
+                if not hdr:
+                    break
+                magic, n, dl = cls.header.unpack(hdr)
+                if magic == cls.magic:
+                    trace.records.extend(f.read(n*cls.record.size))
+                elif magic == cls.magic_v1:
+                    # convert old format records
+                    r = array.array('Q')
+                    r.frombytes(f.read(n*cls.fields_v1*r.itemsize))
+                    for k in range(0, len(r), cls.fields_v1):
+                        trace.records.extend(cls.record.pack(*r[k:k+cls.fields_v1]))
+                else:
+                    raise Exception("Invalid trace file")
+                trace.data.extend(f.read(dl))
+        return trace
+
+    def __len__(self):
+        return len(self.records) // self.record.size
+
+    def __iter__(self):
+        mv = memoryview(self.data)
+        offset = 0
+        for time, port, address, sel, flags, ws, l in self.record.iter_unpack(self.records):
+            yield (time, port, address, sel, bool(flags & 1), ws, bytes(mv[offset:offset+l]))
+            offset += l
+
+    def replay(self, clk, master, port=None, timed=True, name=None):
+        # generator to re-drive trace into WBMaster, yield from test bench
+        # timed: issue each access at its recorded time offset, otherwise back to back
+        yield clk.posedge
+        t0 = now()
+        start = None
+
+        for time, p, address, sel, we, ws, data in self:
+            if port is not None and p != port:
+                continue
+
+            if timed:
+                if start is None:
+                    start = time
+                t = t0 + time - start
+                if t > now():
+                    yield delay(t - now())
+
+            if name is not None:
+                print("[%s] Replay %s a:0x%08x sel:0x%02x" % (name, 'write' if we else 'read', address, sel))
+
+            if not we:
+                master.init_read(address, len(data))
+                continue
+
+            # split write into runs of selected lanes
+            for i, j in sel_runs(sel, len(data) // ws):
+                master.init_write(address+i*ws, data[i*ws:j*ws])
+
+        # wait for replayed accesses to complete
+        while not master.idle():
+            yield clk.posedge
+
+
 class WBRam(object):
-    def __init__(self, size = 1024):
+    def __init__(self, size=None, sparse=False, page_size=4096, fill=0, filename=None, access='w', conflict=None):
+        self.sparse = sparse
+        self.page_size = page_size
+        self.pages = {}
+        self.file = None
+        self.access = access
+
+        # same cycle access ordering between ports
+        # None: unordered, 'read-first': reads see old data, 'write-first': reads
+        # see new data, 'arbitrated': accesses are applied in port order
+        # overlapping writes are always applied in port order
+        assert conflict in (None, 'read-first', 'write-first', 'arbitrated')
+        self.conflict = conflict
+        self.port_stats = []
+        self.pending_access = []
+        self.commit_event = Signal(bool(0))
+        self.has_commit_logic = False
+
+        # access trace, see start_trace
+        self.trace = None
+
+        # checkpoints, each holds original contents of pages first modified
+        # after it was taken (None for unallocated sparse pages)
+        self.checkpoints = []
+
+        # peripheral regions, sorted by start address
+        self.region_starts = []
+        self.region_ends = []
+        self.region_handlers = []
+
+        if size is None:
+            if filename is not None:
+                if not os.path.exists(filename):
+                    raise Exception("Size required to create new backing file")
+                size = os.path.getsize(filename)
+            else:
+                size = 1024
+
         self.size = size
-        self.mem = mmap.mmap(-1, size)
+
+        if filename is not None:
+            # file backed memory
+            # access 'r': read only, 'w': write through to file, 'c': copy on write
+            assert not sparse
+            assert access in ('r', 'w', 'c')
+            if access == 'w':
+                if not os.path.exists(filename):
+                    open(filename, 'wb').close()
+                self.file = open(filename, 'r+b')
+                if os.path.getsize(filename) < size:
+                    self.file.truncate(size)
+                self.mem = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_WRITE)
+            else:
+                self.file = open(filename, 'rb')
+                self.mem = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ if access == 'r' else mmap.ACCESS_COPY)
+            self.mv = memoryview(self.mem)
+        elif sparse:
+            # pages are allocated on first write, unwritten locations read as fill pattern
+            if isinstance(fill, int):
+                fill = bytes([fill])
+            assert page_size % len(fill) == 0
+            self.fill = bytes(fill) * int(page_size / len(fill))
+            self.mem = None
+            self.mv = None
+        else:
+            self.mem = mmap.mmap(-1, size)
+            self.mv = memoryview(self.mem)
 
     def read_mem(self, address, length):
-        self.mem.seek(address)
-        return self.mem.read(length)
+        if self.sparse:
+            ps = self.page_size
+            n, offset = divmod(address, ps)
+            if offset + length <= ps:
+                # single page
+                page = self.pages.get(n, self.fill)
+                return bytes(page[offset:offset+length])
+            data = bytearray()
+            while length > 0:
+                n, offset = divmod(address, ps)
+                l = min(length, ps - offset)
+                page = self.pages.get(n, self.fill)
+                data += page[offset:offset+l]
+                address += l
+                length -= l
+            return bytes(data)
+        return self.mem[address:address+length]
 
     def write_mem(self, address, data):
-        self.mem.seek(address)
-        self.mem.write(data)
-
-    def read_words(self, address, length, ws=2):
-        assert ws in (1, 2, 4, 8)
-        self.mem.seek(int(address*ws))
-        d = []
-        for i in range(length):
-            w = 0
-            data = bytearray(self.mem.read(ws))
-            for j in range(ws-1,-1,-1):
-                w <<= 8
-                w += data[j]
-            d.append(w)
-        return d
+        data = memoryview(data).cast('B')
+        if self.checkpoints:
+            self.save_pages(address, len(data))
+        if self.sparse:
+            ps = self.page_size
+            i = 0
+            while i < len(data):
+                n, offset = divmod(address + i, ps)
+                l = min(len(data) - i, ps - offset)
+                page = self.pages.get(n)
+                if page is None:
+                    page = self.pages[n] = bytearray(self.fill)
+                page[offset:offset+l] = data[i:i+l]
+                i += l
+            return
+        self.mem[address:address+len(data)] = data
+
+    def save_pages(self, address, length):
+        # copy pages on first write after latest checkpoint
+        cp = self.checkpoints[-1]
+        ps = self.page_size
+        for n in range(address // ps, (address+length-1) // ps + 1):
+            if n not in cp:
+                if self.sparse:
+                    page = self.pages.get(n)
+                    cp[n] = None if page is None else bytes(page)
+                else:
+                    cp[n] = self.mem[n*ps:(n+1)*ps]
+
+    def checkpoint(self):
+        # mark current contents, returns checkpoint index for restore
+        self.checkpoints.append({})
+        return len(self.checkpoints)-1
+
+    def restore(self, index=-1):
+        # roll back to checkpoint, only pages modified since are copied
+        # later checkpoints are discarded, restored checkpoint is kept
+        if index < 0:
+            index += len(self.checkpoints)
+        if not 0 <= index < len(self.checkpoints):
+            raise Exception("Invalid checkpoint")
+        ps = self.page_size
+        while len(self.checkpoints) > index:
+            cp = self.checkpoints.pop()
+            for n, page in cp.items():
+                if not self.sparse:
+                    self.mem[n*ps:n*ps+len(page)] = page
+                elif page is None:
+                    self.pages.pop(n, None)
+                else:
+                    self.pages[n] = bytearray(page)
+        self.checkpoints.append({})
+
+    def release(self, index=0):
+        # discard checkpoint and all later checkpoints
+        del self.checkpoints[index:]
+
+    def add_region(self, start, size, read=None, write=None):
+        # map address range to peripheral callbacks instead of storage
+        # read(offset, length) returns bytes, write(offset, data)
+        # read may also be an object with read and write methods
+        # unmapped read reads as zero, unmapped write is ignored
+        if write is None and hasattr(read, 'write'):
+            write = read.write
+        if read is not None and hasattr(read, 'read'):
+            read = read.read
+        end = start + size
+        i = bisect.bisect(self.region_starts, start)
+        if (i > 0 and self.region_ends[i-1] > start) or (i < len(self.region_starts) and self.region_starts[i] < end):
+            raise Exception("Region overlaps existing region")
+        self.region_starts.insert(i, start)
+        self.region_ends.insert(i, end)
+        self.region_handlers.insert(i, (read, write))
+
+    def remove_region(self, start):
+        i = self.region_starts.index(start)
+        del self.region_starts[i]
+        del self.region_ends[i]
+        del self.region_handlers[i]
+
+    def find_region(self, address):
+        # returns (start, read, write) for region containing address, or None
+        i = bisect.bisect(self.region_starts, address) - 1
+        if i >= 0 and address < self.region_ends[i]:
+            return (self.region_starts[i],) + self.region_handlers[i]
+        return None
+
+    def region_read(self, region, address, length):
+        start, read, write = region
+        if read is None:
+            return bytes(length)
+        return bytes(read(address - start, length))
+
+    def compare(self, address, expected):
+        # compare memory contents with expected data
+        # returns address of first mismatch, or None if equal
+        expected = memoryview(expected).cast('B')
+        step = 1 << 20
+        for k in range(0, len(expected), step):
+            l = min(step, len(expected)-k)
+            a = self.read_mem(address+k, l)
+            b = bytes(expected[k:k+l])
+            if a != b:
+                if a == b[:len(a)]:
+                    # short read past end of memory
+                    return address+k+len(a)
+                # bisect to first differing byte
+                lo, hi = 0, len(a)
+                while hi - lo > 1:
+                    mid = (lo + hi) // 2
+                    if a[lo:mid] != b[lo:mid]:
+                        hi = mid
+                    else:
+                        lo = mid
+                return address+k+lo
+        return None
+
+    def diff(self, other, address=0, length=None):
+        # compare with another WBRam or bytes-like image at the same address
+        # returns list of (start, end) address ranges that differ
+        if isinstance(other, WBRam):
+            if length is None:
+                length = min(self.size, other.size) - address
+            read_other = other.read_mem
+        else:
+            other = memoryview(other).cast('B')
+            if length is None:
+                length = len(other)
+            read_other = lambda a, l: bytes(other[a-address:a-address+l])
+        step = 1 << 20
+        ranges = []
+        for k in range(address, address+length, step):
+            l = min(step, address+length-k)
+            a = self.read_mem(k, l)
+            b = read_other(k, l)
+            if a == b:
+                continue
+            n = min(len(a), len(b))
+            if a[:n] != b[:n]:
+                chunk = diff_ranges(a[:n], b[:n], k)
+            else:
+                chunk = []
+            if len(a) != len(b):
+                # one side ends inside this chunk
+                chunk.append((k+n, k+max(len(a), len(b))))
+            for r in chunk:
+                if ranges and ranges[-1][1] == r[0]:
+                    ranges[-1] = (ranges[-1][0], r[1])
+                else:
+                    ranges.append(r)
+        return ranges
+
+    def defer_access(self, port, write, start, end, fn, args):
+        # queue port access for ordered commit at end of current time step
+        self.pending_access.append((port, write, start, end, fn, args))
+        self.commit_event.next = not self.commit_event
+
+    def commit_access(self):
+        acc = self.pending_access
+        self.pending_access = []
+
+        acc.sort(key=lambda x: x[0])
+
+        # overlapping accesses from different ports with at least one write
+        for i in range(len(acc)):
+            for j in range(i+1, len(acc)):
+                if acc[i][0] != acc[j][0] and (acc[i][1] or acc[j][1]) and acc[i][2] < acc[j][3] and acc[j][2] < acc[i][3]:
+                    self.port_stats[acc[i][0]]['conflicts'] += 1
+                    self.port_stats[acc[j][0]]['conflicts'] += 1
+
+        if self.conflict == 'read-first':
+            acc = [x for x in acc if not x[1]] + [x for x in acc if x[1]]
+        elif self.conflict == 'write-first':
+            acc = [x for x in acc if x[1]] + [x for x in acc if not x[1]]
+
+        for x in acc:
+            x[4](*x[5])
+
+    def start_trace(self, filename=None, flush_size=65536):
+        # record all port accesses, optionally streaming to a file
+        self.trace = WBTrace(filename, flush_size)
+        return self.trace
+
+    def stop_trace(self):
+        trace = self.trace
+        self.trace = None
+        if trace is not None:
+            trace.flush()
+        return trace
+
+    def flush(self):
+        # write modified contents back to backing file
+        # read only and copy on write mappings are never written back
+        if self.file is not None and self.access == 'w' and not self.mem.closed:
+            self.mem.flush()
+
+    def snapshot(self, filename, address=0, length=None):
+        # dump memory contents to file
+        if length is None:
+            length = self.size - address
+        with open(filename, 'wb') as f:
+            if self.sparse:
+                ps = self.page_size
+                end = address + length
+                while address < end:
+                    n, offset = divmod(address, ps)
+                    l = min(end - address, ps - offset)
+                    f.write(memoryview(self.pages.get(n, self.fill))[offset:offset+l])
+                    address += l
+            else:
+                f.write(memoryview(self.mem)[address:address+length])
+
+    def load(self, filename, address=0):
+        # load file contents into memory
+        if self.sparse:
+            with open(filename, 'rb') as f:
+                self.write_mem(address, f.read())
+            return
+        with open(filename, 'rb') as f:
+            length = min(os.fstat(f.fileno()).st_size, self.size - address)
+            if self.checkpoints:
+                self.save_pages(address, length)
+            f.readinto(memoryview(self.mem)[address:address+length])
+
+    def close(self):
+        self.flush()
+        if self.mv is not None:
+            self.mv.release()
+            self.mv = None
+        if self.mem is not None:
+            self.mem.close()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def tlm_read(self, address, length):
+        # transaction level bus read
+        address %= self.size
+        if self.region_starts:
+            r = self.find_region(address)
+            if r is not None:
+                return self.region_read(r, address, length)
+        return self.read_mem(address, length)
+
+    def tlm_write(self, address, data):
+        # transaction level bus write
+        address %= self.size
+        if self.region_starts:
+            r = self.find_region(address)
+            if r is not None:
+                if r[2] is not None:
+                    r[2](address - r[0], bytes(data))
+                return
+        self.write_mem(address, data)
+
+    def read_words(self, address, length, ws=2, byteorder='little'):
+        assert ws > 0
+        return unpack_words(self.read_mem(int(address*ws), length*ws), ws, byteorder)
 
     def read_dwords(self, address, length):
         return self.read_words(address, length, 4)
@@ -344,15 +1343,9 @@ class WBRam(object):
     def read_qwords(self, address, length):
         return self.read_words(address, length, 8)
 
-    def write_words(self, address, data, ws=2):
-        assert ws in (1, 2, 4, 8)
-        self.mem.seek(int(address*ws))
-        for w in data:
-            d = []
-            for j in range(ws):
-                d.append(w&0xff)
-                w >>= 8
-            self.mem.write(bytearray(d))
+    def write_words(self, address, data, ws=2, byteorder='little'):
+        assert ws > 0
+        self.write_mem(int(address*ws), pack_words(data, ws, byteorder))
 
     def write_dwords(self, address, length):
         return self.write_words(address, length, 4)
@@ -370,8 +1363,13 @@ class WBRam(object):
                 stb_i=Signal(bool(0)),
                 ack_o=Signal(bool(0)),
                 cyc_i=Signal(bool(0)),
+                cti_i=Signal(intbv(0)[3:]),
+                bte_i=Signal(intbv(0)[2:]),
+                stall_o=Signal(bool(0)),
                 latency=1,
                 asynchronous=False,
+                pipelined=False,
+                fifo_depth=4,
                 name=None
             ):
 
@@ -391,51 +1389,200 @@ class WBRam(object):
         assert ww in (1, 2, 4, 8)
         assert ws in (1, 2, 4, 8)
 
+        # byte lane mask for each select value
+        sel_full = 2**ww-1
+        lane_mask = []
+        for sel in range(2**ww):
+            m = 0
+            for i in range(ww):
+                if sel & (1 << i):
+                    m |= (2**(ws*8)-1) << (i*ws*8)
+            lane_mask.append(m)
+
+        # per port statistics
+        port = len(self.port_stats)
+        stats = {'reads': 0, 'writes': 0, 'conflicts': 0}
+        self.port_stats.append(stats)
+
+        def read_word(addr, sel):
+            a = addr*ws % self.size
+            r = self.find_region(a) if self.region_starts else None
+            if r is not None:
+                val = int.from_bytes(self.region_read(r, a, bw), 'little')
+            elif self.mv is not None:
+                val = int.from_bytes(self.mv[a:a+bw], 'little')
+            else:
+                val = int.from_bytes(self.read_mem(a, bw), 'little')
+            if name is not None:
+                print("[%s] Read word a:0x%08x d:%s" % (name, addr, " ".join(("{:02x}".format(c) for c in val.to_bytes(bw, 'little')))))
+            if self.trace is not None:
+                self.trace.append(now(), port, addr*ws, sel, False, ws, val.to_bytes(bw, 'little'))
+            return val
+
+        def write_word(addr, val, sel):
+            a = addr*ws % self.size
+            if name is not None:
+                print("[%s] Write word a:0x%08x sel:0x%02x d:%s" % (name, addr, sel, " ".join(("{:02x}".format(c) for c in val.to_bytes(bw, 'little')))))
+            if self.trace is not None:
+                self.trace.append(now(), port, addr*ws, sel, True, ws, val.to_bytes(bw, 'little'))
+            if self.region_starts:
+                r = self.find_region(a)
+                if r is not None:
+                    if r[2] is not None:
+                        # pass each run of selected lanes
+                        data = val.to_bytes(bw, 'little')
+                        for i, j in sel_runs(sel, ww):
+                            r[2](a - r[0] + i*ws, data[i*ws:j*ws])
+                    return
+            if self.mv is not None:
+                if sel != sel_full:
+                    if not sel:
+                        return
+                    # merge with unselected lanes
+                    mask = lane_mask[sel]
+                    val = (val & mask) | (int.from_bytes(self.mv[a:a+bw], 'little') & ~mask)
+                if self.checkpoints:
+                    self.save_pages(a, bw)
+                self.mv[a:a+bw] = val.to_bytes(bw, 'little')
+            else:
+                if sel != sel_full:
+                    if not sel:
+                        return
+                    mask = lane_mask[sel]
+                    val = (val & mask) | (int.from_bytes(self.read_mem(a, bw), 'little') & ~mask)
+                self.write_mem(a, val.to_bytes(bw, 'little'))
+
+        def read_out(addr, sel):
+            dat_o.next = read_word(addr, sel)
+
+        def do_read(addr, sel):
+            stats['reads'] += 1
+            if self.conflict is None:
+                dat_o.next = read_word(addr, sel)
+            else:
+                a = addr*ws % self.size
+                self.defer_access(port, False, a, a+bw, read_out, (addr, sel))
+
+        def do_write(addr, val, sel):
+            stats['writes'] += 1
+            if self.conflict is None:
+                write_word(addr, val, sel)
+            else:
+                a = addr*ws % self.size
+                self.defer_access(port, True, a, a+bw, write_word, (addr, val, sel))
+
+        if not self.has_commit_logic:
+            # created with the first port so the policy can be changed later
+            self.has_commit_logic = True
+
+            @instance
+            def commit_logic():
+                while True:
+                    yield self.commit_event
+                    self.commit_access()
+
+        if callable(latency):
+            # latency model, called with byte address and cycle count
+            get_latency = latency
+        else:
+            def get_latency(address, cycle):
+                return latency
+
+        def burst_address(adr, bte):
+            # next address of a burst
+            # bte 0: linear, 1: 4-beat wrap, 2: 8-beat wrap, 3: 16-beat wrap
+            if bte:
+                blk = (4 << (bte-1))*ww
+                return adr - adr % blk + (adr % blk + ww) % blk
+            return adr + ww
+
+        if pipelined:
+            # pipelined mode (Wishbone B4)
+            # requests are accepted into a FIFO while stall_o is low and
+            # acknowledged in order, one per clock, latency cycles later
+            assert not asynchronous
+            assert fifo_depth >= 1
+
+            @instance
+            def logic():
+                fifo = deque()
+                cycle = 0
+
+                while True:
+                    yield clk.posedge
+
+                    cycle += 1
+                    ack_o.next = False
+
+                    if not cyc_i:
+                        # cycle terminated, drop outstanding requests
+                        fifo.clear()
+                    elif stb_i and not stall_o:
+                        # accept request
+                        addr = int(int(adr_i)/ww)*ww
+                        lat = max(get_latency(addr*ws, cycle), 1)
+                        fifo.append((cycle + lat - 1, addr, bool(we_i), int(dat_i), int(sel_i)))
+
+                    if fifo and fifo[0][0] <= cycle:
+                        t, addr, we, val, sel = fifo.popleft()
+                        ack_o.next = True
+                        if we:
+                            do_write(addr, val, sel)
+                        else:
+                            do_read(addr, sel)
+
+                    stall_o.next = len(fifo) >= fifo_depth
+
+            return instances()
+
         @instance
         def logic():
+            # address of burst beat acknowledged ahead of the master
+            burst_addr = None
+            cycle = 0
+
             while True:
                 if asynchronous:
                     yield adr_i, cyc_i, stb_i
                 else:
                     yield clk.posedge
+                    cycle += 1
 
                 ack_o.next = False
 
-                # address in increments of bus word width
-                addr = int(int(adr_i)/ww)*ww
+                if burst_addr is not None:
+                    # acknowledged burst beat completes on this edge
+                    addr = burst_addr
+                    burst_addr = None
+                    if cyc_i & stb_i & we_i:
+                        do_write(addr, int(dat_i), int(sel_i))
+                else:
+                    # address in increments of bus word width
+                    addr = int(int(adr_i)/ww)*ww
+
+                if not asynchronous and cyc_i & stb_i & ack_o and int(cti_i) in (0b001, 0b010):
+                    # registered feedback burst
+                    # prefetch next beat and acknowledge without wait states
+                    if int(cti_i) == 0b010:
+                        addr = burst_address(addr, int(bte_i))
+                    ack_o.next = True
+                    burst_addr = addr
+                    if not we_i:
+                        do_read(addr, int(sel_i))
 
-                if cyc_i & stb_i & ~ack_o:
+                elif cyc_i & stb_i & ~ack_o:
                     if asynchronous:
-                        yield delay(latency)
+                        yield delay(get_latency(addr*ws, now()))
                     else:
-                        for i in range(latency):
+                        for i in range(get_latency(addr*ws, cycle)):
                             yield clk.posedge
+                            cycle += 1
                     ack_o.next = True
-                    self.mem.seek(addr*ws % self.size)
                     if we_i:
                         # write
-                        data = []
-                        val = int(dat_i)
-                        for i in range(bw):
-                            data += [val & 0xff]
-                            val >>= 8
-                        data = bytearray(data)
-                        for i in range(ww):
-                            if sel_i & (1 << i):
-                                self.mem.write(data[i*ws:(i+1)*ws])
-                            else:
-                                self.mem.seek(ws, 1)
-                        if name is not None:
-                            print("[%s] Write word a:0x%08x sel:0x%02x d:%s" % (name, addr, sel_i, " ".join(("{:02x}".format(c) for c in bytearray(data)))))
+                        do_write(addr, int(dat_i), int(sel_i))
                     else:
-                        data = bytearray(self.mem.read(bw))
-                        val = 0
-                        for i in range(bw-1,-1,-1):
-                            val <<= 8
-                            val += data[i]
-                        dat_o.next = val
-                        if name is not None:
-                            print("[%s] Read word a:0x%08x d:%s" % (name, addr, " ".join(("{:02x}".format(c) for c in bytearray(data)))))
+                        do_read(addr, int(sel_i))
 
         return instances()
 